@@ -0,0 +1,92 @@
+"""Admission control for the CPU-bound semantic tier.
+
+At most max_concurrency requests run the semantic tier at once (their encodes
+are still micro-batched by QueryBatcher); up to max_queue more wait for a slot
+until their deadline. Anything beyond that is rejected immediately, so under
+overload some requests fail fast instead of all of them getting slow:
+
+    try:
+        with admission.slot(deadline):
+            ...
+    except Overloaded as e:
+        ...  # e.reason ("queue_full" / "deadline"), e.retry_after (seconds)
+
+Deadlines are time.monotonic() values.
+"""
+
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 16):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self._cond = threading.Condition()
+        self._running = 0
+        self._waiting = 0
+        # moving average of the time a slot is held, for Retry-After estimates
+        self._service_time = 0.05
+        self._counts = Counter()
+
+    def retry_after(self) -> float:
+        """Rough time until the current backlog has drained, in seconds."""
+        backlog = self._running + self._waiting
+        return backlog * self._service_time / self.max_concurrency
+
+    @contextmanager
+    def slot(self, deadline: Optional[float] = None):
+        """Hold one of the max_concurrency slots for the block, or raise Overloaded."""
+        with self._cond:
+            if self._running >= self.max_concurrency:
+                if self._waiting >= self.max_queue:
+                    self._counts["queue_full"] += 1
+                    raise Overloaded("queue_full", self.retry_after())
+                self._waiting += 1
+                try:
+                    while self._running >= self.max_concurrency:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            self._counts["deadline"] += 1
+                            raise Overloaded("deadline", self.retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._running += 1
+            self._counts["admitted"] += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            held = time.monotonic() - started
+            with self._cond:
+                self._running -= 1
+                self._service_time = 0.9 * self._service_time + 0.1 * held
+                self._cond.notify()
+
+    def reject_late(self):
+        """Count a request admitted in time whose work then overran its deadline."""
+        with self._cond:
+            self._counts["deadline"] += 1
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "waiting": self._waiting,
+                "service_time_ms": self._service_time * 1000.0,
+                "admitted": self._counts["admitted"],
+                "rejected": {"queue_full": self._counts["queue_full"], "deadline": self._counts["deadline"]},
+            }
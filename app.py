@@ -1,15 +1,41 @@
 import time
 
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
+import hashlib
+import math
 import os
-import numpy as np
-from qa_store import QuestionAnswerStore
+import threading
+import chart_data
+import http_encoding
+import metrics
+from admission import AdmissionController, Overloaded
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from qa_store import open_store
+from query_batcher import QueryBatcher
+from query_cache import QueryResultCache, normalize_query
+from search_index import SubstringIndex
+from search_payloads import SearchPayloads, json_array
+from suggest_index import SuggestIndex, read_phrases
+from vector_index import build_index
+from embedding_index import (EMBEDDINGS_DTYPE, MODEL_NAME as SBERT_MODEL_NAME, artifact_lock, artifact_paths,
+                             content_hash, load_embeddings, normalize_rows, question_corpus)
 
 BASE_DIR = os.path.dirname(__file__)
-STORE_PATH = os.path.join(BASE_DIR, "data/qa_store.json")
+# QA_STORE_BACKEND=sqlite serves data/qa_store.sqlite3 (see qa_store_sqlite.py migrate)
+STORE_BACKEND = os.environ.get("QA_STORE_BACKEND", "json")
+STORE_PATH = os.environ.get("QA_STORE_PATH") or os.path.join(
+    BASE_DIR, "data/qa_store.sqlite3" if STORE_BACKEND == "sqlite" else "data/qa_store.json")
 
 app = Flask(__name__, template_folder="templates")
-store = QuestionAnswerStore(STORE_PATH)
+if STORE_BACKEND == "sqlite":
+    store = open_store(STORE_PATH, backend="sqlite")
+else:
+    # QA_STORE_WAL=1 appends mutations to a write-ahead log instead of rewriting the JSON
+    store = open_store(
+        STORE_PATH, backend="json",
+        wal=True if os.environ.get("QA_STORE_WAL") == "1" else None,
+        fsync=os.environ.get("QA_STORE_FSYNC", "always"),
+    )
 
 # Configure logging so debug messages are visible both in dev and under gunicorn
 import logging
@@ -53,52 +79,379 @@ else:
     app.logger.propagate = True
     logging.getLogger('werkzeug').setLevel(loglevel)
 
+# Trigram index over question texts for the substring tier of /api/search
+# (case, accent and whitespace-insensitive, like the result cache keys)
+_substring_index = SubstringIndex.from_questions(store.iter_questions(), fold=normalize_query)
+
+# Ready-to-serialize result objects (answers already joined), one per question
+_search_payloads = SearchPayloads(store)
+
+# Prefix index of /api/suggest: question texts, descriptions and key phrases
+SUGGEST_KEYPHRASES_FILE = os.environ.get('SUGGEST_KEYPHRASES_FILE') or os.path.join(BASE_DIR, 'data/keyphrase.txt')
+SUGGEST_LIMIT = int(os.environ.get('SUGGEST_LIMIT', '8'))
+
+
+def _suggest_sources():
+    yield 'keyphrases', read_phrases(SUGGEST_KEYPHRASES_FILE), None
+    for qid, qobj in store.iter_questions():
+        yield ('question', qid), [qobj.get('text') or '', qobj.get('description') or ''], qid
+
+
+_suggest_index = SuggestIndex.build(_suggest_sources(), fold=normalize_query)
+
+
+# Question additions / edits seen (store events), and how many of them the semantic
+# index reflects; the store watcher re-encodes the difference
+_semantic_changes = 0
+_semantic_synced = 0
+# The same for the lexical index, which applies changes in place once it exists: the
+# changes that arrive while the warm-up builds it are made up by a rebuild
+_lexical_changes = 0
+_lexical_synced = 0
+_lexical_lock = threading.Lock()
+# Wakes the store watcher up before its next poll (a mutation made by this process)
+_store_changed = threading.Event()
+
+
+def _on_store_change(event: str, payload: dict):
+    """Keep the in-process search indexes in sync with store mutations (ours or, through
+    store.refresh(), other processes')."""
+    global _substring_index, _lexical_index, _suggest_index, _semantic_changes, _lexical_changes, _lexical_synced
+    # payloads first: an id the indexes below return must already have a fragment
+    # (searches run concurrently on request threads; ids without one are skipped)
+    _search_payloads.on_store_event(event, payload)
+    if event == 'reset':
+        _substring_index = SubstringIndex.from_questions(store.iter_questions(), fold=normalize_query)
+        _suggest_index = SuggestIndex.build(_suggest_sources(), fold=normalize_query,
+                                            searches=_suggest_index.searches())
+        with _lexical_lock:
+            _lexical_changes += 1
+            if _lexical_index is not None:
+                from lexical_index import LexicalIndex
+                _lexical_index = LexicalIndex(zip(*question_corpus(store.iter_questions())))
+                _lexical_synced = _lexical_changes
+    elif event == 'add_question':
+        qid = payload['question_id']
+        qobj = store.get_question(qid)
+        _substring_index.add(qid, qobj.get('text') or '')
+        _suggest_index.set_source(('question', qid), [qobj.get('text') or '', qobj.get('description') or ''], qid)
+        with _lexical_lock:
+            _lexical_changes += 1
+            if _lexical_index is not None:
+                _ids, texts = question_corpus([(qid, qobj)])
+                _lexical_index.add(qid, texts[0])
+                _lexical_synced += 1
+    if event in ('add_question', 'reset'):
+        _semantic_changes += 1
+        _store_changed.set()
+
+
+store.add_listener(_on_store_change)
+
 # --- New: fast semantic matcher using Sentence-Transformers (SBERT) ---
+# Only probe for the package here: importing it (and torch) is done by the warm-up thread
+import importlib.util
 try:
-    from sentence_transformers import SentenceTransformer, util as st_util
+    SBERT_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
+except ValueError:
+    # already in sys.modules without a spec (e.g. an injected stand-in)
     SBERT_AVAILABLE = True
-except Exception:
-    SBERT_AVAILABLE = False
-
-# Prepare data for semantic search
-_question_ids = []
-_question_texts = []
-for qid, qobj in store._data.get('questions', {}).items():
-    _question_ids.append(qid)
-    # Combine text and description for richer semantic matching
-    text = (qobj.get('text') or '').strip()
-    desc = (qobj.get('description') or '').strip()
-    combined = f"{text}. {desc}" if desc else text
-    _question_texts.append(combined)
 
+# --- Lexical tier: char n-gram TF-IDF over text + description, in front of SBERT ---
+# scikit-learn takes a second to import: lexical_index is imported by the warm-up thread
+LEXICAL_AVAILABLE = importlib.util.find_spec("sklearn") is not None
+
+# Lexical matches scoring at least LEXICAL_THRESHOLD are answered without running SBERT
+LEXICAL_THRESHOLD = float(os.environ.get('LEXICAL_THRESHOLD', '0.75'))
+# Without SBERT, lexical matches above LEXICAL_MIN_SCORE are returned as a degraded answer
+LEXICAL_MIN_SCORE = float(os.environ.get('LEXICAL_MIN_SCORE', '0.2'))
+
+_lexical_index = None
 _sbert_model = None
-_question_embeddings = None
-if SBERT_AVAILABLE and _question_texts:
+# (question ids, their text hashes, vector index over their embeddings): replaced as
+# one reference, so a search always sees ids and rows that belong together
+_semantic_index = None
+# incremented on every swap of _semantic_index (part of the result cache version)
+_semantic_generation = 0
+
+# --- Warm-up: lexical index, SBERT model and embeddings load after startup ---
+# The id and substring tiers serve as soon as the module is imported; the lexical
+# and semantic tiers join when their part of the warm-up is done (until then
+# /api/search answers with whatever tiers are ready). WARMUP_MODE=sync loads
+# everything before the import returns (scripts, debugging).
+WARMUP_MODE = os.environ.get('WARMUP_MODE', 'background')
+# One query per line, run through the semantic tier so the first real request is not a cold forward pass
+WARMUP_QUERIES_FILE = os.environ.get('WARMUP_QUERIES_FILE') or os.path.join(BASE_DIR, 'data/warmup_queries.txt')
+DEFAULT_WARMUP_QUERIES = ["Est-ce que l'IA peut m'aider ?", "Analyse de documents", "Prédire les ventes"]
+
+_ready = threading.Event()
+_warmup_state = {"status": "starting", "lexical": False, "semantic": False, "error": None, "seconds": {}}
+
+
+def _warmup_queries():
+    try:
+        with open(WARMUP_QUERIES_FILE, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    except OSError:
+        queries = []
+    return queries or DEFAULT_WARMUP_QUERIES
+
+
+def _load_lexical_index():
+    """Build the lexical index (at warm-up, and again if changes arrived meanwhile)."""
+    global _lexical_index, _lexical_synced
+    if not LEXICAL_AVAILABLE:
+        return
+    try:
+        from lexical_index import LexicalIndex
+        # changes from here on are counted; the store watcher rebuilds if any was missed
+        changes = _lexical_changes
+        index = LexicalIndex(zip(*question_corpus(store.iter_questions())))
+        with _lexical_lock:
+            _lexical_index = index
+            _lexical_synced = changes
+        _warmup_state["lexical"] = True
+    except Exception as e:
+        app.logger.exception('Failed to build lexical index: %s', e)
+
+
+def _build_semantic_index(model, previous=None):
+    """(ids, hashes, index) for the current store questions.
+
+    Rows come from the shared on-disk artifact: only questions whose text hash is
+    not in it are encoded, and the artifact is rewritten for the other workers.
+    With a previous (ids, hashes, index), an edit or addition only updates the
+    affected rows of the index instead of rebuilding it.
+    """
+    ids, texts = question_corpus(store.iter_questions())
+    hashes = [content_hash(t) for t in texts]
+    with artifact_lock(STORE_PATH):
+        # Reuse the on-disk embeddings artifact; only new/edited questions are encoded.
+        # The result is a read-only memory map shared by every gunicorn worker.
+        embeddings, encoded = load_embeddings(
+            STORE_PATH, SBERT_MODEL_NAME, ids, texts,
+            lambda batch: model.encode(batch, convert_to_numpy=True, show_progress_bar=False),
+            dtype=EMBEDDINGS_DTYPE,
+        )
+        if previous is not None and ids[:len(previous[0])] == previous[0]:
+            old_hashes = previous[1]
+            rows = [i for i, h in enumerate(hashes) if i >= len(old_hashes) or old_hashes[i] != h]
+            index = previous[2].updated(embeddings, rows)
+        else:
+            # VECTOR_INDEX=ivf trades exactness for speed on large corpora (exact below IVF_MIN_ROWS);
+            # VECTOR_INDEX=int8 scores 4x smaller quantized codes (slower than exact), re-ranking the
+            # best INT8_RERANK exactly from the shared memory map
+            index_kwargs = {}
+            if os.environ.get('VECTOR_INDEX') == 'ivf':
+                index_kwargs = {'nprobe': int(os.environ.get('IVF_NPROBE', '8'))}
+                if os.environ.get('IVF_NLISTS'):
+                    index_kwargs['n_lists'] = int(os.environ['IVF_NLISTS'])
+            elif os.environ.get('VECTOR_INDEX') == 'int8':
+                index_kwargs = {
+                    'rerank': int(os.environ.get('INT8_RERANK', '50')),
+                    'cache_path': artifact_paths(STORE_PATH)[1][:-len('.npy')] + '.int8.npy',
+                }
+            index = build_index(embeddings, os.environ.get('VECTOR_INDEX', 'exact'), **index_kwargs)
+    app.logger.info('Semantic index over %d questions (%d encoded, %s)', len(ids), encoded, index.kind)
+    return ids, hashes, index
+
+
+def _load_semantic():
+    global SBERT_AVAILABLE, _sbert_model, _semantic_index, _semantic_generation, _semantic_synced
+    if not SBERT_AVAILABLE or next(store.iter_questions(), None) is None:
+        return
+    try:
+        from sentence_transformers import SentenceTransformer
+    except Exception as e:
+        app.logger.exception('Failed to import sentence_transformers: %s', e)
+        SBERT_AVAILABLE = False
+        return
     try:
         # Use a lightweight multilingual model that works well for French & English
         # 'paraphrase-multilingual-MiniLM-L12-v2' is ~420MB, fast, and accurate
         # Alternative: 'all-MiniLM-L6-v2' (English only, smaller ~80MB)
-        _sbert_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-        _question_embeddings = _sbert_model.encode(_question_texts, convert_to_tensor=True, show_progress_bar=False)
-        app.logger.info('Built SBERT embeddings for %d questions', len(_question_texts))
+        model = SentenceTransformer(SBERT_MODEL_NAME)
+        # edits made from here on are picked up by the store watcher
+        changes = _semantic_changes
+        semantic_index = _build_semantic_index(model)
     except Exception as e:
         app.logger.exception('Failed to build SBERT embeddings: %s', e)
-        _sbert_model = None
-        _question_embeddings = None
+        _warmup_state["error"] = str(e)
+        return
+    # publish the model last: semantic search only runs once everything it needs is set
+    _semantic_index = semantic_index
+    _semantic_synced = changes
+    _semantic_generation += 1
+    _sbert_model = model
+    _warmup_state["semantic"] = True
+
+    # first forward passes (and query-embedding cache entries) before real traffic
+    queries = _warmup_queries()
+    for query in queries:
+        semantic_search_questions(query)
+    semantic_search_batch(queries)
+
+
+def _warm_up():
+    started = time.perf_counter()
+    _warmup_state["status"] = "warming"
+    for name, step in (("lexical", _load_lexical_index), ("semantic", _load_semantic)):
+        step_started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            app.logger.exception('Warm-up step %s failed: %s', name, e)
+            _warmup_state["error"] = str(e)
+        _warmup_state["seconds"][name] = round(time.perf_counter() - step_started, 3)
+    _warmup_state["seconds"]["total"] = round(time.perf_counter() - started, 3)
+    _warmup_state["status"] = "ready"
+    app.logger.info('Warm-up done in %.2fs (lexical=%s, semantic=%s)', time.perf_counter() - started,
+                    _warmup_state["lexical"], _warmup_state["semantic"])
+    _ready.set()
+
+
+def wait_until_ready(timeout=None) -> bool:
+    """Block until the warm-up is over (successful or not); False on timeout."""
+    return _ready.wait(timeout)
+
+
+# --- Live store changes: other workers' and admin scripts' writes ---
+# Every STORE_POLL_INTERVAL seconds (0 disables it) the store watcher loads what
+# other processes wrote (store.refresh(): one small file read when nothing
+# changed), which updates the in-process indexes through _on_store_change. The
+# semantic index is then rebuilt off the request path from the artifact, encoding
+# only edited or added questions; searches in flight keep the index they started with.
+STORE_POLL_INTERVAL = float(os.environ.get('STORE_POLL_INTERVAL', '1.0'))
+
+
+def _semantic_in_sync() -> bool:
+    return _semantic_index is None or _semantic_synced == _semantic_changes
+
+
+def _refresh_semantic():
+    global _semantic_index, _semantic_generation, _semantic_synced
+    previous = _semantic_index
+    if _sbert_model is None or previous is None:
+        return
+    changes = _semantic_changes
+    try:
+        semantic_index = _build_semantic_index(_sbert_model, previous)
+    except Exception as e:
+        app.logger.exception('Failed to refresh SBERT embeddings: %s', e)
+        return
+    # searches in flight keep the index they read; new ones get this one
+    _semantic_index = semantic_index
+    _semantic_synced = changes
+    _semantic_generation += 1
+
+
+def _watch_store():
+    while True:
+        _store_changed.wait(STORE_POLL_INTERVAL)
+        _store_changed.clear()
+        try:
+            store.refresh()
+            if _lexical_index is not None and _lexical_synced != _lexical_changes:
+                _load_lexical_index()
+            if not _semantic_in_sync():
+                _refresh_semantic()
+        except Exception as e:
+            app.logger.exception('Store refresh failed: %s', e)
+            time.sleep(STORE_POLL_INTERVAL)
+
+
+# Concurrent query encodes (gunicorn threads) are grouped into a single forward pass
+_query_batcher = QueryBatcher(
+    lambda queries: normalize_rows(_sbert_model.encode(queries, convert_to_numpy=True, show_progress_bar=False)),
+    max_batch_size=int(os.environ.get('QUERY_BATCH_MAX_SIZE', '8')),
+    max_wait_ms=float(os.environ.get('QUERY_BATCH_MAX_WAIT_MS', '2')),
+)
+
+# Per-stage search metrics, served at /metrics (METRICS_ENABLED=0 disables them)
+SEARCH_STAGE_SECONDS = metrics.Histogram(
+    "search_stage_seconds", "Duration of each /api/search stage", labelnames=("stage",))
+SEARCH_REQUEST_SECONDS = metrics.Histogram(
+    "search_request_seconds", "Duration of /api/search requests by answering tier", labelnames=("tier",))
+QUERY_EMBEDDING_CACHE = metrics.Counter(
+    "query_embedding_cache_total", "Query-embedding cache lookups by result (hit/miss)", labelnames=("result",))
+
+SUGGEST_REQUEST_SECONDS = metrics.Histogram(
+    "suggest_request_seconds", "Duration of /api/suggest lookups",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+
+QUERY_RESULT_CACHE = metrics.Counter(
+    "search_result_cache_total", "/api/search result cache lookups by result (hit/miss)", labelnames=("result",))
+
+# Final /api/search responses keyed on the normalized query, bounded in bytes and
+# dropped whenever the search version changes (RESULT_CACHE_MAX_BYTES=0 disables it)
+_result_cache = QueryResultCache(
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(16 << 20))),
+    ttl=float(os.environ.get('RESULT_CACHE_TTL', '300')),
+)
+
+
+def _search_version() -> int:
+    """Moves forward on every store mutation and every swap of the semantic index."""
+    return store.version + _semantic_generation
+
+
+# --- Strong ETags of /api/search responses (see http_encoding.py) ---
+# A full response is determined by the store content, the search configuration and
+# the normalized query. store.state_id is the store-wide change counter shared by
+# all workers plus the identity of the snapshot it counts from, so any worker can
+# answer a 304 for a tag another one issued, and a snapshot edited while the app
+# was stopped (or a fresh .seq file) gets new tags. The seed covers the model and
+# the search configuration; the tag also says whether the semantic tier is loaded.
+_SEARCH_ENV_PREFIXES = ('LEXICAL_', 'VECTOR_INDEX', 'IVF_', 'INT8_', 'EMBEDDINGS_')
+_ETAG_SEED = hashlib.sha1('\n'.join(
+    [SBERT_MODEL_NAME, STORE_PATH] + [f'{k}={v}' for k, v in sorted(os.environ.items())
+                                      if k.startswith(_SEARCH_ENV_PREFIXES)]).encode('utf-8')).hexdigest()[:12]
+
+
+def _search_etag(key: str):
+    """Tag of the full response to key at the store's current state, or None while the
+    semantic index still lags behind the store (the response may change without seq)."""
+    # state first: it only moves after the listeners counted the changes behind it
+    state = store.state_id
+    if not _semantic_in_sync():
+        return None
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+    # a lexical-only worker (SBERT not installed) never matches a tag of a semantic one
+    tiers = 's' if _sbert_model is not None else 'l'
+    return f'{_ETAG_SEED}.{state}.{tiers}.{digest}'
+
+# --- Admission control in front of the semantic tier (see admission.py) ---
+# SEMANTIC_MAX_CONCURRENCY requests run the semantic tier at once, SEMANTIC_MAX_QUEUE more may wait
+_admission = AdmissionController(
+    max_concurrency=int(os.environ.get('SEMANTIC_MAX_CONCURRENCY', '4')),
+    max_queue=int(os.environ.get('SEMANTIC_MAX_QUEUE', '16')),
+)
+# Budget of a request, from its arrival, to get a slot and its query embedding
+SEARCH_DEADLINE_MS = float(os.environ.get('SEARCH_DEADLINE_MS', '2000'))
+# Overloaded requests get the lexical fallback flagged by X-Search-Degraded ("degraded"),
+# or a 429 with Retry-After ("429")
+OVERLOAD_RESPONSE = os.environ.get('OVERLOAD_RESPONSE', 'degraded')
+SEARCH_OVERLOAD = metrics.Counter(
+    "search_overload_total", "Requests turned away from the semantic tier, by reason", labelnames=("reason",))
 
 # Small LRU cache for query embeddings to avoid recomputing for repeated queries
 from functools import lru_cache
 
+# miss: set by _get_cached_embedding_tuple when it actually runs, i.e. on a cache miss;
+# timeout: how long this thread's request may still wait for its embedding
+_embedding_call = threading.local()
+
 @lru_cache(maxsize=512)
 def _get_cached_embedding_tuple(query: str):
-    """Cache embeddings for repeated queries. Returns tuple for hashability."""
+    """Cache normalized embeddings for repeated queries."""
     if _sbert_model is None:
         return None
-    emb = _sbert_model.encode(query, convert_to_tensor=True, show_progress_bar=False)
-    return emb
+    _embedding_call.miss = True
+    with SEARCH_STAGE_SECONDS.time(stage="encode"):
+        return _query_batcher.encode(query, timeout=getattr(_embedding_call, 'timeout', None))
 
 
-def semantic_search_questions(query: str, top_k: int = 5):
+def semantic_search_questions(query: str, top_k: int = 5, deadline=None):
     """
     Find the most semantically similar questions using SBERT embeddings.
 
@@ -107,28 +460,50 @@ def semantic_search_questions(query: str, top_k: int = 5):
     - If multiple results between 0.5 and 0.7: return up to 3 best in that range
     - If no result >= 0.5: return the single best match regardless of score
 
-    Returns list of (question_id, similarity_score) tuples.
+    Returns list of (question_id, similarity_score) tuples. With a deadline
+    (time.monotonic() value), waiting for the query embedding past it raises
+    concurrent.futures.TimeoutError.
     """
-    HIGH_THRESHOLD = 0.7
-    MID_THRESHOLD = 0.5
-
-    if _sbert_model is None or _question_embeddings is None:
+    semantic_index = _semantic_index
+    if _sbert_model is None or semantic_index is None:
         return []
 
+    _embedding_call.miss = False
+    _embedding_call.timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
     query_embedding = _get_cached_embedding_tuple(query)
+    QUERY_EMBEDDING_CACHE.inc(result="miss" if _embedding_call.miss else "hit")
     if query_embedding is None:
         return []
 
-    # Compute cosine similarities
-    cos_scores = st_util.cos_sim(query_embedding, _question_embeddings)[0]
+    # Top-k cosine similarities against the shared (normalized) embedding matrix
+    with SEARCH_STAGE_SECONDS.time(stage="similarity"):
+        top_idx, top_scores = semantic_index[2].search(query_embedding, top_k)
+        return _select_semantic_matches(semantic_index[0], top_idx, top_scores)
+
 
-    # Get top-k results sorted by score
-    top_results = cos_scores.topk(k=min(top_k, len(_question_ids)))
+def semantic_search_batch(queries, top_k: int = 5):
+    """semantic_search_questions() for many queries: one encode call, one matrix product.
+
+    Returns one list of (question_id, similarity_score) tuples per query, in order.
+    """
+    semantic_index = _semantic_index
+    if _sbert_model is None or semantic_index is None or not queries:
+        return [[] for _q in queries]
+    # batch calls record one encode / similarity sample per batch
+    with SEARCH_STAGE_SECONDS.time(stage="encode"):
+        embeddings = normalize_rows(_sbert_model.encode(list(queries), convert_to_numpy=True, show_progress_bar=False))
+    with SEARCH_STAGE_SECONDS.time(stage="similarity"):
+        return [_select_semantic_matches(semantic_index[0], top_idx, top_scores)
+                for top_idx, top_scores in semantic_index[2].search_batch(embeddings, top_k)]
+
+
+def _select_semantic_matches(question_ids, top_idx, top_scores):
+    """Apply the semantic_search_questions threshold strategy to top-k rows of the index."""
+    HIGH_THRESHOLD = 0.7
+    MID_THRESHOLD = 0.5
 
     # Build list of (qid, score)
-    all_matches = []
-    for score, idx in zip(top_results.values, top_results.indices):
-        all_matches.append((_question_ids[int(idx)], float(score)))
+    all_matches = [(question_ids[int(idx)], float(sim)) for idx, sim in zip(top_idx, top_scores)]
 
     if not all_matches:
         return []
@@ -149,84 +524,323 @@ def semantic_search_questions(query: str, top_k: int = 5):
     return [all_matches[0]]
 
 
+# Per-tier hit counters of /api/search (exposed at /api/stats)
+from collections import Counter
+
+_tier_hits = Counter()
+_tier_lock = threading.Lock()
+
+
+def _count_tier(tier: str):
+    with _tier_lock:
+        _tier_hits[tier] += 1
+
+
+def _json_body(fragments) -> bytes:
+    """JSON array body from pre-encoded result fragments."""
+    with SEARCH_STAGE_SECONDS.time(stage="serialization"):
+        return json_array(fragments)
+
+
+def _fast_tiers(q: str, lexical_results=None):
+    """Run the exact-id, substring and lexical tiers for one (stripped, non-empty) query.
+
+    Returns (tier, fragments, lexical_results); tier is None when nothing matched
+    confidently and the semantic tier must decide.
+    """
+    # Quick exact-id shortcut
+    with SEARCH_STAGE_SECONDS.time(stage="id"):
+        id_match = _search_payloads.fragment(q) if q.isdigit() else None
+    if id_match is not None:
+        app.logger.debug('question id exact match found : %s', q)
+        return 'id', [id_match], []
+
+    # Substring search, narrowed by the trigram index
+    with SEARCH_STAGE_SECONDS.time(stage="substring"):
+        fragments = _scored_fragments((qid, None) for qid in _substring_index.search(q))
+    if fragments:
+        return 'substring', fragments, []
+
+    # Lexical TF-IDF tier: confident matches skip the transformer entirely
+    if lexical_results is None:
+        with SEARCH_STAGE_SECONDS.time(stage="lexical"):
+            lexical_results = _lexical_index.search(q, top_k=5) if _lexical_index is not None else []
+    confident = [(q_id, sim) for q_id, sim in lexical_results if sim >= LEXICAL_THRESHOLD][:3]
+    if confident:
+        app.logger.debug('Lexical match %s', confident)
+        return 'lexical', _scored_fragments(confident), lexical_results
+    return None, [], lexical_results
+
+
+def _slow_tiers(semantic_results, lexical_results):
+    """Turn semantic matches (None if SBERT was unavailable/failed) into (tier, fragments)."""
+    fragments = _scored_fragments(semantic_results or [])
+    if fragments:
+        return 'semantic', fragments
+
+    # Degraded mode (SBERT unavailable or failed): best lexical matches, if any
+    degraded = [(q_id, sim) for q_id, sim in lexical_results if sim >= LEXICAL_MIN_SCORE][:3]
+    if degraded:
+        return 'lexical_degraded', _scored_fragments(degraded)
+
+    # final fallback: empty
+    return 'none', []
+
+
+def _scored_fragments(matches):
+    """Fragments of (question id, similarity or None) matches, skipping ids the search
+    payloads do not hold (the indexes may briefly lag behind a store change)."""
+    fragments = (_search_payloads.fragment(q_id, similarity_score=sim) for q_id, sim in matches)
+    return [fragment for fragment in fragments if fragment is not None]
+
+
 @app.route("/api/search")
 def api_search():
-    starting_time = time.time()
-    start_search_time = time.time()
+    started = time.perf_counter()
+    deadline = time.monotonic() + SEARCH_DEADLINE_MS / 1000.0
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify([])
     app.logger.debug("Search query received: %r", q)
-    results = []
 
-    # Quick exact-id shortcut
-    if q.isdigit() and q in store._data.get("questions", {}):
-        qobj = store._data["questions"][q]
-        results.append({
-            "id": q,
-            "text": qobj.get("text", ""),
-            "description": qobj.get("description", ""),
-            "answers": store.get_answers_for_question(q),
-        })
-        app.logger.debug(f'question id exact match found : {qobj}', )
-        return jsonify(results)
-
-    # Simple substring search
-    qlow = q.lower()
-    for qid, qobj in store._data.get("questions", {}).items():
-        text = (qobj.get("text") or "").strip()
-        if qlow in text.lower():
-            results.append({
-                "id": qid,
-                "text": text,
-                "description": qobj.get("description", ""),
-                "answers": store.get_answers_for_question(qid),
-            })
-    if results:
-        app.logger.debug('search time first part (substring): %.3f sec', time.time() - start_search_time)
-        return jsonify(results)
-
-
-    app.logger.debug("search time first part: %.2f seconds", time.time() - start_search_time)
-
-    # Use fast SBERT semantic search as fallback
-    if SBERT_AVAILABLE and _sbert_model is not None:
-        try:
-            start_semantic_time = time.time()
-            semantic_results = semantic_search_questions(q, top_k=5)
-            app.logger.debug("SBERT semantic search took: %.3f seconds", time.time() - start_semantic_time)
-
-            for q_id, score in semantic_results:
-                if q_id in store._data.get("questions", {}):
-                    qobj = store._data["questions"][q_id]
-                    results.append({
-                        "id": q_id,
-                        "text": qobj.get("text", ""),
-                        "description": qobj.get("description", ""),
-                        "answers": store.get_answers_for_question(q_id),
-                        "similarity_score": round(score, 3),
-                    })
-                    app.logger.debug("Matched question id=%s with score=%.3f", q_id, score)
-
-            if results:
-                app.logger.debug('Total search time: %.3f seconds', time.time() - starting_time)
-                return jsonify(results)
-        except Exception as e:
-            app.logger.exception("SBERT search failed: %s", e)
+    # Variants of the same query ("Analyse Fumée", "analyse fumee") share one entry
+    key = normalize_query(q)
+    # a search for a suggested phrase makes it more popular
+    _suggest_index.record(key)
+    # read before searching: a concurrent mutation then makes this entry stale, not wrong
+    version = _search_version()
+    etag = _search_etag(key)
+    # the client already holds this exact response: no tier runs at all
+    not_modified = http_encoding.not_modified(request, etag) if etag else None
+    if not_modified is not None:
+        _count_tier('not_modified')
+        SEARCH_REQUEST_SECONDS.observe(time.perf_counter() - started, tier='not_modified')
+        return not_modified
+
+    cached = _result_cache.get(key, version)
+    if cached is not None:
+        QUERY_RESULT_CACHE.inc(result="hit")
+        _count_tier('cache')
+        response = http_encoding.encoded_response(request, cached[1], 'application/json', etag)
+        SEARCH_REQUEST_SECONDS.observe(time.perf_counter() - started, tier='cache')
+        return response
+    QUERY_RESULT_CACHE.inc(result="miss")
+
+    try:
+        tier, fragments, degraded = _search_one(q, deadline)
+    except Overloaded as e:
+        _count_tier('rejected')
+        SEARCH_REQUEST_SECONDS.observe(time.perf_counter() - started, tier='rejected')
+        return _overloaded_response(e)
+    _count_tier(tier)
+    body = _json_body(fragments)
+    # don't keep (or tag) answers that were degraded for a transient reason (warm-up, overload, error)
+    if _ready.is_set() and degraded in (None, 'unavailable'):
+        _result_cache.put(key, version, tier, body)
+    else:
+        etag = None
+    response = http_encoding.encoded_response(request, body, 'application/json', etag)
+    if degraded:
+        response.headers['X-Search-Degraded'] = degraded
+    SEARCH_REQUEST_SECONDS.observe(time.perf_counter() - started, tier=tier)
+    return response
+
+
+def _search_one(q: str, deadline=None):
+    """All the /api/search tiers for one (stripped, non-empty) query.
+
+    Returns (tier, fragments, degraded): degraded is None, or why the semantic
+    tier was skipped ("warming_up", "unavailable", "queue_full", "deadline",
+    "error"). Raises Overloaded instead when OVERLOAD_RESPONSE is "429".
+    """
+    tier, fragments, lexical_results = _fast_tiers(q)
+    if tier is not None:
+        return tier, fragments, None
+    if not SBERT_AVAILABLE or _sbert_model is None:
+        if not SBERT_AVAILABLE:
+            degraded = 'unavailable'
+        elif not _ready.is_set():
+            degraded = 'warming_up'
+        elif _warmup_state["error"]:
+            # installed, but this worker failed to load it: transient, never cached or tagged
+            degraded = 'error'
+        else:
+            degraded = 'unavailable'
+        return _slow_tiers(None, lexical_results) + (degraded,)
+
+    # Use fast SBERT semantic search as fallback, if a slot frees up in time
+    semantic_results = None
+    degraded = None
+    try:
+        with _admission.slot(deadline):
+            try:
+                semantic_results = semantic_search_questions(q, top_k=5, deadline=deadline)
+            except FutureTimeoutError:
+                _admission.reject_late()
+                raise Overloaded('deadline', _admission.retry_after())
+        for q_id, sim in semantic_results:
+            app.logger.debug("Matched question id=%s with score=%.3f", q_id, sim)
+    except Overloaded as e:
+        SEARCH_OVERLOAD.inc(reason=e.reason)
+        app.logger.warning("Semantic tier overloaded (%s) for %r", e.reason, q)
+        if OVERLOAD_RESPONSE == '429':
+            raise
+        degraded = e.reason
+    except Exception as e:
+        app.logger.exception("SBERT search failed: %s", e)
+        degraded = 'error'
+
+    return _slow_tiers(semantic_results, lexical_results) + (degraded,)
+
+
+def _overloaded_response(e: Overloaded):
+    response = jsonify({"error": "overloaded", "reason": e.reason})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, math.ceil(e.retry_after)))
+    return response
 
-    # final fallback: empty
-    return jsonify([])
+
+def search_many(queries, deadline=None):
+    """Run the /api/search tiers for many queries; returns [(tier, fragments)] in input order.
+
+    Exact-id, substring and lexical tiers run per query; all the queries that
+    reach the semantic tier share one encode call and one matrix product. With a
+    deadline, that call goes through admission control like /api/search.
+    """
+    queries = [x.strip() for x in queries]
+    with SEARCH_STAGE_SECONDS.time(stage="lexical"):
+        lexical = _lexical_index.search_batch(queries, top_k=5) if _lexical_index is not None else [[] for _q in queries]
+    outcomes = [None] * len(queries)
+    pending = []
+    for i, q in enumerate(queries):
+        if not q:
+            outcomes[i] = (None, [])
+            continue
+        tier, fragments, lexical[i] = _fast_tiers(q, lexical_results=lexical[i])
+        if tier is None:
+            pending.append(i)
+        else:
+            _count_tier(tier)
+            outcomes[i] = (tier, fragments)
+
+    if pending:
+        semantic = [None] * len(pending)
+        if SBERT_AVAILABLE and _sbert_model is not None:
+            try:
+                if deadline is None:
+                    semantic = semantic_search_batch([queries[i] for i in pending], top_k=5)
+                else:
+                    with _admission.slot(deadline):
+                        semantic = semantic_search_batch([queries[i] for i in pending], top_k=5)
+            except Overloaded as e:
+                SEARCH_OVERLOAD.inc(reason=e.reason)
+                app.logger.warning("Semantic tier overloaded (%s) for a batch of %d", e.reason, len(pending))
+                if OVERLOAD_RESPONSE == '429':
+                    raise
+            except Exception as e:
+                app.logger.exception("SBERT batch search failed: %s", e)
+        for i, semantic_results in zip(pending, semantic):
+            outcomes[i] = _slow_tiers(semantic_results, lexical[i])
+            _count_tier(outcomes[i][0])
+
+    return outcomes
+
+
+# Maximum number of queries accepted by one /api/search/batch request
+BATCH_MAX_QUERIES = int(os.environ.get('SEARCH_BATCH_MAX_QUERIES', '1000'))
+
+
+@app.route("/api/search/batch", methods=["POST"])
+def api_search_batch():
+    """Search many queries at once.
+
+    Body: {"queries": ["...", ...]} (or a bare JSON list). Response: a JSON list
+    with, for each query in input order, exactly what /api/search?q=... returns.
+    """
+    body = request.get_json(silent=True)
+    queries = body.get("queries") if isinstance(body, dict) else body
+    if not isinstance(queries, list) or not all(isinstance(x, str) for x in queries):
+        return jsonify({"error": "expected a JSON list of query strings, or {\"queries\": [...]}"}), 400
+    if len(queries) > BATCH_MAX_QUERIES:
+        return jsonify({"error": f"too many queries (max {BATCH_MAX_QUERIES})"}), 400
+
+    try:
+        outcomes = [fragments for _tier, fragments in
+                    search_many(queries, deadline=time.monotonic() + SEARCH_DEADLINE_MS / 1000.0)]
+    except Overloaded as e:
+        return _overloaded_response(e)
+    with SEARCH_STAGE_SECONDS.time(stage="serialization"):
+        body = b"[" + b",".join(json_array(fragments) for fragments in outcomes) + b"]"
+    return http_encoding.encoded_response(request, body, 'application/json')
+
+
+@app.route("/api/suggest")
+def api_suggest():
+    """Search-as-you-type: most popular phrases with a word starting with ?prefix= (never runs the model)."""
+    prefix = request.args.get("prefix") or ""
+    limit = request.args.get("limit", SUGGEST_LIMIT, type=int)
+    with SUGGEST_REQUEST_SECONDS.time():
+        suggestions = _suggest_index.suggest(prefix, limit)
+    return jsonify(suggestions)
+
+
+@app.route("/healthz")
+def healthz():
+    """Liveness: the process serves requests (id and substring tiers work from the start)."""
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    """Readiness: 200 once the warm-up is over, 503 while the model and indexes load."""
+    body = dict(_warmup_state, seconds=dict(_warmup_state["seconds"]))
+    return jsonify(body), (200 if _ready.is_set() else 503)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text format; summed over all gunicorn workers when METRICS_DIR is set."""
+    if not metrics.METRICS_ENABLED:
+        return Response("metrics disabled\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route("/api/stats")
+def api_stats():
+    with _tier_lock:
+        hits = dict(_tier_hits)
+    total = sum(hits.values())
+    return jsonify({
+        "query_batcher": _query_batcher.stats(),
+        "result_cache": _result_cache.stats(),
+        "admission": _admission.stats(),
+        "suggest": _suggest_index.stats(),
+        "store": {"seq": store.seq, "version": store.version, "semantic_in_sync": _semantic_in_sync(),
+                  "semantic_rows": len(_semantic_index[0]) if _semantic_index is not None else 0},
+        "search_tiers": {
+            "hits": hits,
+            "rates": {tier: n / total for tier, n in hits.items()} if total else {},
+        },
+    })
 
 
 @app.route('/api/answer-data/<answer_id>')
 def api_answer_data(answer_id):
-    # For testing: when answer_id == '4' return 10 random x/y points
-    if answer_id == '3':
-        xs = list(range(1, 1001))
-        len_xs = len(xs)
-        ys = [ 100 * np.log10(x) / np.log10(len_xs)  for x in xs]
-        return jsonify({"x": xs, "y": ys})
-    return jsonify({"error": "no data for this answer"}), 404
+    """Chart of an answer (see chart_data.py): ?max_points=N downsamples, ?format=f32 is binary."""
+    if not chart_data.has_chart(answer_id):
+        return jsonify({"error": "no data for this answer"}), 404
+    fmt = request.args.get("format", "json")
+    if fmt not in chart_data.FORMATS:
+        return jsonify({"error": f"unknown format (expected one of {sorted(chart_data.FORMATS)})"}), 400
+    max_points = request.args.get("max_points", type=int)
+    if max_points is not None and not 3 <= max_points <= chart_data.MAX_POINTS_LIMIT:
+        return jsonify({"error": f"max_points must be between 3 and {chart_data.MAX_POINTS_LIMIT}"}), 400
+    body, etag = chart_data.encoded(answer_id, max_points, fmt)
+    # always revalidated: 304 while the chart is unchanged
+    not_modified = http_encoding.not_modified(request, etag)
+    if not_modified is not None:
+        return not_modified
+    return http_encoding.encoded_response(request, body, chart_data.FORMATS[fmt], etag)
 
 
 @app.route("/")
@@ -234,6 +848,15 @@ def index():
     return render_template("index.html")
 
 
+# Start the warm-up and the store watcher last, once every function they call is defined
+if WARMUP_MODE == 'sync':
+    _warm_up()
+else:
+    threading.Thread(target=_warm_up, name='warm-up', daemon=True).start()
+if STORE_POLL_INTERVAL > 0:
+    threading.Thread(target=_watch_store, name='store-watcher', daemon=True).start()
+
+
 if __name__ == "__main__":
     # Simple local server for development
     app.run(debug=True, host="127.0.0.1", port=5000)
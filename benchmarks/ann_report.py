@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Recall@k / latency / memory report: approximate vector indexes vs the exact brute-force search.
+
+Synthetic corpora are clustered unit vectors (a mixture of Gaussians, like
+sentence embeddings of many phrasings of a few hundred ideas); queries are
+noisy copies of corpus rows. The exact index gives the ground truth.
+
+Usage:
+    python benchmarks/ann_report.py                         # 10k and 100k rows
+    python benchmarks/ann_report.py --sizes 10000,300000 --dim 384 --queries 200 --k 5
+    python benchmarks/ann_report.py --out ann_report.json    # also write machine-readable results
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from embedding_index import normalize_rows  # noqa: E402
+from vector_index import ExactIndex, Int8Index, IVFIndex  # noqa: E402
+
+
+def synthetic_corpus(n: int, dim: int, n_topics: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = normalize_rows(rng.standard_normal((n_topics, dim)))
+    rows = topics[rng.integers(0, n_topics, size=n)] + 0.6 * rng.standard_normal((n, dim)) / np.sqrt(dim)
+    return normalize_rows(rows)
+
+
+def noisy_queries(matrix: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    base = matrix[rng.integers(0, matrix.shape[0], size=n)]
+    return normalize_rows(base + 0.3 * rng.standard_normal(base.shape) / np.sqrt(matrix.shape[1]))
+
+
+def measure(index, queries: np.ndarray, k: int, **kwargs):
+    latencies = []
+    found = []
+    for q in queries:
+        t = time.perf_counter()
+        idx, _scores = index.search(q, k, **kwargs)
+        latencies.append(time.perf_counter() - t)
+        found.append(idx)
+    lat_ms = np.array(latencies) * 1000.0
+    return found, {"p50_ms": float(np.percentile(lat_ms, 50)), "p95_ms": float(np.percentile(lat_ms, 95)),
+                   "mean_ms": float(lat_ms.mean())}
+
+
+def recall_at_k(found, truth) -> float:
+    hits = sum(len(set(map(int, f)) & set(map(int, t))) for f, t in zip(found, truth))
+    return hits / float(sum(len(t) for t in truth))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nprobe", default="1,4,8,16,32")
+    parser.add_argument("--rerank", default="0,20,50", help="int8 re-rank candidate counts")
+    parser.add_argument("--out", help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = []
+    for n in [int(s) for s in args.sizes.split(",")]:
+        matrix = synthetic_corpus(n, args.dim, n_topics=max(10, n // 200))
+        queries = noisy_queries(matrix, args.queries)
+
+        exact = ExactIndex(matrix)
+        truth, exact_lat = measure(exact, queries, args.k)
+        print(f"\n{n} rows x {args.dim} dims, {args.queries} queries, k={args.k}")
+        print(f"  {'index':<22}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'build s':>10}{'MB':>8}")
+        exact_mb = matrix.nbytes / 1e6
+        print(f"  {'exact':<22}{1.0:>10.3f}{exact_lat['p50_ms']:>10.3f}{exact_lat['p95_ms']:>10.3f}{0.0:>10.2f}"
+              f"{exact_mb:>8.1f}")
+        results.append({"rows": n, "index": "exact", "recall": 1.0, "build_s": 0.0, "mb": exact_mb, **exact_lat})
+
+        t = time.perf_counter()
+        ivf = IVFIndex(matrix)
+        build_s = time.perf_counter() - t
+        for nprobe in [int(p) for p in args.nprobe.split(",")]:
+            found, lat = measure(ivf, queries, args.k, nprobe=nprobe)
+            recall = recall_at_k(found, truth)
+            name = f"ivf({ivf.n_lists}, nprobe={nprobe})"
+            print(f"  {name:<22}{recall:>10.3f}{lat['p50_ms']:>10.3f}{lat['p95_ms']:>10.3f}{build_s:>10.2f}"
+                  f"{exact_mb:>8.1f}")
+            results.append({"rows": n, "index": "ivf", "n_lists": ivf.n_lists, "nprobe": nprobe,
+                            "recall": recall, "build_s": build_s, "mb": exact_mb, **lat})
+
+        t = time.perf_counter()
+        int8 = Int8Index(matrix)
+        build_s = time.perf_counter() - t
+        # codes + scales + inverse norms, plus the float matrix that re-ranking keeps
+        # referenced (resident here; only the re-ranked rows when it is a memory map)
+        codes_mb = (int8.codes.nbytes + 8 * n) / 1e6
+        for rerank in [int(r) for r in args.rerank.split(",")]:
+            int8.rerank = rerank
+            int8_mb = codes_mb + (exact_mb if rerank else 0.0)
+            found, lat = measure(int8, queries, args.k)
+            recall = recall_at_k(found, truth)
+            name = f"int8(rerank={rerank})"
+            print(f"  {name:<22}{recall:>10.3f}{lat['p50_ms']:>10.3f}{lat['p95_ms']:>10.3f}{build_s:>10.2f}"
+                  f"{int8_mb:>8.1f}")
+            results.append({"rows": n, "index": "int8", "rerank": rerank, "recall": recall,
+                            "build_s": build_s, "mb": int8_mb, **lat})
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"dim": args.dim, "k": args.k, "queries": args.queries, "results": results}, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""Latency / throughput / startup / memory benchmark of the /api/search path.
+
+For each corpus size a synthetic store in the qa_store.json schema is generated
+and the app is imported in a fresh subprocess, with a deterministic offline stub
+in place of sentence_transformers (hashed character trigrams, no model download,
+no network). Then four query sets are sent through /api/search:
+
+  - id        : existing question ids (exact-id tier)
+  - substring : slices of existing question texts (substring tier)
+  - lexical   : shuffled question words plus an unknown token, so the substring
+                tier misses and the lexical tier answers
+  - semantic  : the same kind of queries with the lexical shortcut disabled
+                (LEXICAL_THRESHOLD above 1), so they reach the semantic tier
+
+Latencies are grouped by the tier that actually answered (read from the app's
+tier counters). semantic_search_questions() is also timed on its own, with a
+cold query-embedding cache. import_s is the `import app` time (store load, id
+and substring indexes); startup_s also includes the background warm-up (lexical
+index, model, embeddings) up to readiness. RSS is read after startup.
+
+Usage:
+    python benchmarks/search_bench.py                           # 1k, 10k, 100k questions
+    python benchmarks/search_bench.py --sizes 1000,1000000 --queries 500 --out bench.json
+    python benchmarks/search_bench.py --compare before.json --out after.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import zlib
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+STUB_DIM = 384
+SYLLABLES = ["ma", "ri", "to", "ne", "lu", "ca", "po", "se", "di", "va", "bo", "fe", "gu", "la", "mi",
+             "ro", "te", "ni", "su", "pa", "de", "ko", "ve", "ji", "zo", "ba", "fi", "ge", "ho", "ju"]
+
+
+class StubSentenceTransformer:
+    """Deterministic stand-in for sentence_transformers.SentenceTransformer."""
+
+    def __init__(self, name: str = "stub", **kwargs):
+        self.name = name
+
+    def encode(self, sentences, convert_to_numpy=True, show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        out = np.zeros((len(texts), STUB_DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            low = " " + text.lower() + " "
+            buckets = [zlib.crc32(low[i:i + 3].encode("utf-8")) for i in range(len(low) - 2)]
+            if buckets:
+                b = np.array(buckets, dtype=np.uint32)
+                signs = np.where(b & 1, 1.0, -1.0).astype(np.float32)
+                np.add.at(out[row], (b >> 1) % STUB_DIM, signs)
+        return out[0] if single else out
+
+
+def install_stub_encoder():
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = StubSentenceTransformer
+    sys.modules["sentence_transformers"] = module
+
+
+def synthetic_store(path: str, n_questions: int, n_answers: int = 50, seed: int = 0) -> dict:
+    """Write a qa_store.json-shaped file with n_questions questions; returns its data."""
+    rng = random.Random(seed)
+    vocab = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(20000)})
+    questions = {}
+    answers = {str(a): {"text": f"Réponse {a} # paragraphe {a}", "questions": []} for a in range(1, n_answers + 1)}
+    for q in range(1, n_questions + 1):
+        qid = str(q)
+        words = rng.sample(vocab, rng.randint(2, 5))
+        aid = str(rng.randint(1, n_answers))
+        questions[qid] = {"text": " ".join(words).capitalize(),
+                          "description": " ".join(words + rng.sample(vocab, 2)), "answers": [aid]}
+        answers[aid]["questions"].append(qid)
+    data = {"questions": questions, "answers": answers}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    return data
+
+
+def query_sets(data: dict, n: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    qids = list(data["questions"])
+    picks = [data["questions"][rng.choice(qids)]["text"] for _ in range(n)]
+    substring = []
+    for text in picks:
+        start = rng.randrange(0, max(1, len(text) - 6))
+        substring.append(text[start:start + rng.randint(6, 12)].strip() or text)
+    shuffled = []
+    for text in [data["questions"][rng.choice(qids)]["text"] for _ in range(2 * n)]:
+        words = text.lower().split()
+        rng.shuffle(words)
+        shuffled.append(" ".join(words + ["xyzzy%d" % rng.randint(0, 9999)]))
+    return {"id": [rng.choice(qids) for _ in range(n)], "substring": substring,
+            "lexical": shuffled[:n], "semantic": shuffled[n:]}
+
+
+def summarize(latencies) -> dict:
+    if not latencies:
+        return {"count": 0}
+    ms = np.array(latencies) * 1000.0
+    return {"count": len(ms), "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean()), "qps": float(1000.0 / ms.mean())}
+
+
+def rss_mb() -> dict:
+    """Current and peak resident set size of this process, in MB."""
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    out["rss_mb" if line.startswith("VmRSS") else "peak_rss_mb"] = int(line.split()[1]) / 1024.0
+    except OSError:
+        import resource
+        out["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return out
+
+
+def run_size(n: int, n_queries: int) -> dict:
+    """Benchmark one corpus size in this process (called in a fresh subprocess)."""
+    install_stub_encoder()
+    sys.path.insert(0, ROOT)
+    with tempfile.TemporaryDirectory(prefix="search_bench_") as tmp:
+        store_path = os.path.join(tmp, "qa_store.json")
+        t = time.perf_counter()
+        data = synthetic_store(store_path, n)
+        generate_s = time.perf_counter() - t
+        queries = query_sets(data, n_queries)
+        del data
+
+        os.environ["QA_STORE_PATH"] = store_path
+        os.environ["QA_STORE_BACKEND"] = "json"
+        os.environ.setdefault("LOGLEVEL", "WARNING")
+        # measure the tiers themselves, not the normalized-query result cache
+        os.environ.setdefault("RESULT_CACHE_MAX_BYTES", "0")
+        t = time.perf_counter()
+        import app
+        import_s = time.perf_counter() - t
+        app.wait_until_ready()
+        startup_s = time.perf_counter() - t
+        memory = rss_mb()
+
+        client = app.app.test_client()
+        client.get("/api/search", query_string={"q": queries["semantic"][0]})  # warm-up
+        by_tier = {}
+        lexical_threshold = app.LEXICAL_THRESHOLD
+        for name, queries_of_set in queries.items():
+            app.LEXICAL_THRESHOLD = 2.0 if name == "semantic" else lexical_threshold
+            for q in queries_of_set:
+                before = dict(app._tier_hits)
+                t = time.perf_counter()
+                response = client.get("/api/search", query_string={"q": q})
+                elapsed = time.perf_counter() - t
+                assert response.status_code == 200
+                tier = next((k for k, v in app._tier_hits.items() if v != before.get(k, 0)), "none")
+                by_tier.setdefault(tier, []).append(elapsed)
+        app.LEXICAL_THRESHOLD = lexical_threshold
+
+        app._get_cached_embedding_tuple.cache_clear()
+        direct = []
+        for q in queries["semantic"]:
+            t = time.perf_counter()
+            app.semantic_search_questions(q, top_k=5)
+            direct.append(time.perf_counter() - t)
+
+        return {"questions": n, "generate_s": generate_s, "import_s": import_s, "startup_s": startup_s, **memory,
+                "vector_index": getattr(app._semantic_index[2], "kind", None) if app._semantic_index else None,
+                "tiers": {tier: summarize(lat) for tier, lat in sorted(by_tier.items())},
+                "semantic_search_questions": summarize(direct)}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_result(result: dict, baseline: dict = None):
+    print(f"\n{result['questions']} questions: import {result['import_s']:.2f}s, ready {result['startup_s']:.2f}s, "
+          f"RSS {result.get('rss_mb', 0):.0f} MB, index {result['vector_index']}")
+    print(f"  {'tier':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'qps':>10}")
+    rows = dict(result["tiers"], semantic_search_questions=result["semantic_search_questions"])
+    base_rows = dict(baseline["tiers"], semantic_search_questions=baseline["semantic_search_questions"]) \
+        if baseline else {}
+    for tier, s in rows.items():
+        if not s.get("count"):
+            continue
+        line = f"  {tier:<28}{s['count']:>7}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}{s['qps']:>10.0f}"
+        base = base_rows.get(tier)
+        if base and base.get("count"):
+            line += f"   p50 x{s['p50_ms'] / base['p50_ms']:.2f}, p95 x{s['p95_ms'] / base['p95_ms']:.2f}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=200, help="queries per query set")
+    parser.add_argument("--out", help="write the results as JSON to this path")
+    parser.add_argument("--compare", help="previous --out file to compare latencies against")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_size:
+        print(json.dumps(run_size(args.run_size, args.queries)))
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {r["questions"]: r for r in json.load(f)["results"]}
+
+    results = []
+    for n in [int(s) for s in args.sizes.split(",")]:
+        # one fresh interpreter per size: clean startup time and RSS
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-size", str(n),
+                               "--queries", str(args.queries)], capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            return proc.returncode
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print_result(result, baseline.get(n))
+        results.append(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"commit": git_commit(), "queries": args.queries, "encoder": f"stub-{STUB_DIM}",
+                       "results": results}, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Memory / latency comparison of the QA store's in-memory layouts.
+
+  - dict  : the qa_store.json structure as loaded by json.load (what
+            QuestionAnswerStore kept in memory before QAGraph), with links as
+            lists of id strings, mutated the way the store used to
+            (`in` + append, index + del)
+  - graph : QAGraph (qa_models.py), i.e. interned integer ids, __slots__ models
+            and ordered-set adjacency
+
+A synthetic store with --links links is generated: every question links to
+--per-question answers, one of them a "hub" answer (a handful of answers shared
+by a large share of the questions, like a generic answer in the real data) and
+the others picked uniformly. Reported: memory held by each layout (tracemalloc,
+after the JSON text is parsed), load and to-JSON times, and the latency of
+link + remove_link and of the two adjacency reads, on random pairs and on hub
+answers.
+
+Usage:
+    python benchmarks/store_layout_bench.py                    # 1M links
+    python benchmarks/store_layout_bench.py --links 100000 --ops 20000
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from qa_models import QAGraph  # noqa: E402
+
+N_HUBS = 10
+
+
+def synthetic_json(n_links: int, per_question: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    n_questions = n_links // per_question
+    n_answers = max(N_HUBS + 1, n_questions // 5)
+    questions = {}
+    answers = {str(a): {"text": f"Réponse {a} # paragraphe {a}", "questions": []} for a in range(1, n_answers + 1)}
+    for q in range(1, n_questions + 1):
+        qid = str(q)
+        linked = {str(rng.randint(1, N_HUBS))}
+        while len(linked) < per_question:
+            linked.add(str(rng.randint(N_HUBS + 1, n_answers)))
+        questions[qid] = {"text": f"Question {q} ?", "description": f"question numéro {q}", "answers": sorted(linked)}
+        for aid in questions[qid]["answers"]:
+            answers[aid]["questions"].append(qid)
+    return json.dumps({"questions": questions, "answers": answers}, ensure_ascii=False)
+
+
+# --- the dict layout, operated as QuestionAnswerStore used to ---
+
+def dict_link(data, aid, qid):
+    for lst, item in ((data["questions"][qid]["answers"], aid), (data["answers"][aid]["questions"], qid)):
+        if item not in lst:
+            lst.append(item)
+
+
+def dict_unlink(data, aid, qid):
+    for lst, item in ((data["questions"][qid]["answers"], aid), (data["answers"][aid]["questions"], qid)):
+        if item in lst:
+            del lst[lst.index(item)]
+
+
+def dict_answers_of(data, qid):
+    answers = data["answers"]
+    return [{"id": aid, "text": answers[aid]["text"]} for aid in data["questions"][qid]["answers"] if aid in answers]
+
+
+def dict_questions_of(data, aid):
+    questions = data["questions"]
+    return [{"id": qid, "text": questions[qid]["text"], "description": questions[qid].get("description", "")}
+            for qid in data["answers"][aid]["questions"] if qid in questions]
+
+
+# --- the graph layout, operated as QuestionAnswerStore does now ---
+
+def graph_answers_of(graph, qid):
+    return [{"id": a.id, "text": a.text} for a in graph.answers_of(graph.question(qid))]
+
+
+def graph_questions_of(graph, aid):
+    return [{"id": q.id, "text": q.text, "description": q.description}
+            for q in graph.questions_of(graph.answer(aid))]
+
+
+LAYOUTS = {
+    "dict": {"load": json.loads, "dump": lambda data: data, "link": dict_link, "unlink": dict_unlink,
+             "answers_of": dict_answers_of, "questions_of": dict_questions_of},
+    "graph": {"load": lambda text: QAGraph.from_dict(json.loads(text)), "dump": QAGraph.to_dict,
+              "link": lambda g, aid, qid: g.link(aid, qid), "unlink": lambda g, aid, qid: g.unlink(aid, qid),
+              "answers_of": graph_answers_of, "questions_of": graph_questions_of},
+}
+
+
+def per_op_us(fn, pairs) -> float:
+    t = time.perf_counter()
+    for args in pairs:
+        fn(*args)
+    return (time.perf_counter() - t) / max(1, len(pairs)) * 1e6
+
+
+def bench_layout(name: str, text: str, n_ops: int, seed: int = 1) -> dict:
+    ops = LAYOUTS[name]
+    gc.collect()
+    tracemalloc.start()
+    t = time.perf_counter()
+    store = ops["load"](text)
+    load_s = time.perf_counter() - t
+    gc.collect()
+    memory_mb = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+
+    t = time.perf_counter()
+    json.dumps(ops["dump"](store), ensure_ascii=False)
+    dump_s = time.perf_counter() - t
+
+    rng = random.Random(seed)
+    qids = list(store["questions"]) if name == "dict" else [q.id for q in store.iter_questions()]
+    aids = list(store["answers"]) if name == "dict" else [a.id for a in store.iter_answers()]
+    hubs = [str(h) for h in range(1, N_HUBS + 1)]
+    # link, then unlink, random pairs (most of them not linked yet)
+    random_pairs = [(rng.choice(aids[N_HUBS:]), rng.choice(qids)) for _ in range(n_ops)]
+    hub_pairs = [(rng.choice(hubs), rng.choice(qids)) for _ in range(n_ops)]
+    result = {"layout": name, "memory_mb": memory_mb, "load_s": load_s, "to_json_s": dump_s}
+    for label, pairs in (("random", random_pairs), ("hub", hub_pairs)):
+        result[f"link_{label}_us"] = per_op_us(lambda a, q: ops["link"](store, a, q), pairs)
+        result[f"unlink_{label}_us"] = per_op_us(lambda a, q: ops["unlink"](store, a, q), pairs)
+    result["answers_of_question_us"] = per_op_us(lambda q: ops["answers_of"](store, q),
+                                                 [(rng.choice(qids),) for _ in range(n_ops)])
+    result["questions_of_answer_us"] = per_op_us(lambda a: ops["questions_of"](store, a),
+                                                 [(rng.choice(aids[N_HUBS:]),) for _ in range(n_ops)])
+    result["questions_of_hub_us"] = per_op_us(lambda a: ops["questions_of"](store, a),
+                                              [(rng.choice(hubs),) for _ in range(max(1, n_ops // 100))])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--links", type=int, default=1_000_000)
+    parser.add_argument("--per-question", type=int, default=10, help="links per question")
+    parser.add_argument("--ops", type=int, default=50_000, help="operations per latency measurement")
+    parser.add_argument("--out", help="write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    text = synthetic_json(args.links, args.per_question)
+    print(f"{args.links} links, {args.links // args.per_question} questions, JSON {len(text) / 2 ** 20:.0f} MB")
+    results = [bench_layout(name, text, args.ops) for name in LAYOUTS]
+    keys = [k for k in results[0] if k != "layout"]
+    print(f"  {'':<26}" + "".join(f"{r['layout']:>12}" for r in results) + f"{'ratio':>10}")
+    for key in keys:
+        values = [r[key] for r in results]
+        ratio = values[1] / values[0] if values[0] else float("nan")
+        print(f"  {key:<26}" + "".join(f"{v:>12.3f}" for v in values) + f"{ratio:>10.2f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"links": args.links, "per_question": args.per_question, "ops": args.ops,
+                       "results": results}, f, indent=2)
+        print(f"\nWrote {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
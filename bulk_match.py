@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Offline bulk matching of idea files against the QA store.
+
+Every idea is run through the same tiers as /api/search (exact id, substring,
+lexical, semantic) without going through HTTP. Input files are streamed in
+chunks to a pool of worker processes; each worker imports the app once, so the
+SBERT model is loaded once per worker and the question embeddings are the
+shared memory-mapped artifact (refreshed once up front, before the pool starts).
+At most a few chunks are in flight, so memory stays constant whatever the file
+size, and results are written in input order.
+
+Inputs:
+  - *.csv : one idea per row, taken from the "Idea" / "Idée IA" column (else the last one)
+  - other : one idea per line; blank lines and "# ..." comments are skipped
+
+Outputs (one record per idea):
+  - .jsonl : {"source", "line", "idea", "tier", "matches": [{"id", "text", "similarity_score", "answers"}]}
+  - .csv   : source, line, idea, tier, best match id / text / score, all match ids
+
+A checkpoint (<out>.checkpoint) records how many ideas were written; running the
+same command again after an interruption resumes from there (--fresh restarts).
+
+Usage:
+    python bulk_match.py data/people_ai_ideas_*.csv data/new_ideas.txt -o matches.jsonl
+    python bulk_match.py big_export.csv -o matches.csv --workers 4 --chunk-size 512
+"""
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Tuple
+
+IDEA_COLUMNS = ("idea", "idée ia", "idée", "idee")
+CSV_FIELDS = ["source", "line", "idea", "tier", "match_id", "match_text", "similarity_score", "match_ids"]
+
+_app = None
+
+
+def iter_ideas(paths: List[str]) -> Iterator[Tuple[str, int, str]]:
+    """Yield (source, line number, idea) for every idea of the input files, in order."""
+    for path in paths:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            if path.lower().endswith(".csv"):
+                rows = csv.reader(f)
+                header = next(rows, [])
+                names = [h.strip().casefold() for h in header]
+                col = next((names.index(c) for c in IDEA_COLUMNS if c in names), len(header) - 1)
+                for line, row in enumerate(rows, start=2):
+                    if col < len(row) and row[col].strip():
+                        yield path, line, row[col].strip()
+            else:
+                for line, text in enumerate(f, start=1):
+                    text = text.strip()
+                    if text and not text.startswith("#"):
+                        yield path, line, text
+
+
+def chunked(iterable, size: int):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _init_worker(torch_threads: int = 0):
+    global _app
+    os.environ.setdefault("LOGLEVEL", "WARNING")
+    import app as _app_module
+
+    # the model and indexes load in a background thread; match with every tier
+    _app_module.wait_until_ready()
+    _app = _app_module
+    if torch_threads and "torch" in sys.modules:
+        # workers x threads should not oversubscribe the cores
+        sys.modules["torch"].set_num_threads(torch_threads)
+
+
+def match_chunk(chunk: List[Tuple[str, int, str]]) -> List[dict]:
+    """Match one chunk of (source, line, idea) with app.search_many (runs in a worker)."""
+    if _app is None:
+        _init_worker()
+    records = []
+    outcomes = _app.search_many([idea for _source, _line, idea in chunk])
+    for (source, line, idea), (tier, fragments) in zip(chunk, outcomes):
+        matches = json.loads(_app.json_array(fragments))
+        for m in matches:
+            m["answers"] = [a["id"] for a in m.get("answers", [])]
+            m.pop("description", None)
+        records.append({"source": source, "line": line, "idea": idea, "tier": tier or "none", "matches": matches})
+    return records
+
+
+def _csv_row(record: dict) -> list:
+    best = record["matches"][0] if record["matches"] else {}
+    return [record["source"], record["line"], record["idea"], record["tier"], best.get("id", ""),
+            best.get("text", ""), best.get("similarity_score", ""), ";".join(m["id"] for m in record["matches"])]
+
+
+def _csv_text(rows: List[list], header: bool) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(CSV_FIELDS)
+    writer.writerows(rows)
+    return buf.getvalue()
+
+
+def _read_checkpoint(path: str, inputs: List[str]) -> Tuple[int, int]:
+    """(ideas done, output byte offset) from a checkpoint for the same inputs, else (0, 0)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return 0, 0
+    if state.get("inputs") != inputs:
+        return 0, 0
+    return int(state["done"]), int(state["offset"])
+
+
+def _write_checkpoint(path: str, inputs: List[str], done: int, offset: int):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"inputs": inputs, "done": done, "offset": offset}, f)
+    os.replace(tmp, path)
+
+
+def _refresh_embeddings():
+    """Bring the embeddings artifact up to date once, so workers only memory-map it."""
+    import importlib.util
+
+    if importlib.util.find_spec("sentence_transformers") is None:
+        return
+    import embedding_index
+
+    embedding_index.main(["embedding_index.py", embedding_index.STORE_PATH])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="idea files (.csv or plain text)")
+    parser.add_argument("-o", "--out", required=True, help="output file (.jsonl or .csv)")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="worker processes (0 = match in this process)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="ideas per worker task")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    inputs = [os.path.abspath(p) for p in args.inputs]
+    as_csv = args.out.lower().endswith(".csv")
+    checkpoint = args.out + ".checkpoint"
+    done, offset = (0, 0) if args.fresh else _read_checkpoint(checkpoint, inputs)
+    if done and os.path.exists(args.out):
+        print(f"Resuming after {done} ideas", file=sys.stderr)
+    else:
+        done, offset = 0, 0
+
+    _refresh_embeddings()
+
+    out = open(args.out, "r+b" if offset else "wb")
+    out.truncate(offset)  # drop anything written after the last checkpoint
+    out.seek(offset)
+    chunks = chunked(islice(iter_ideas(args.inputs), done, None), args.chunk_size)
+
+    tiers = Counter()
+    matched = 0
+    started = last_report = time.perf_counter()
+
+    def write(records):
+        nonlocal done, matched, last_report
+        if as_csv:
+            text = _csv_text([_csv_row(r) for r in records], header=(out.tell() == 0))
+        else:
+            text = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        out.write(text.encode("utf-8"))
+        out.flush()
+        done += len(records)
+        matched += len(records)
+        tiers.update(r["tier"] for r in records)
+        _write_checkpoint(checkpoint, inputs, done, out.tell())
+        now = time.perf_counter()
+        if now - last_report >= 5:
+            last_report = now
+            print(f"{done} ideas, {matched / (now - started):.1f} ideas/s", file=sys.stderr)
+
+    if args.workers <= 0:
+        for chunk in chunks:
+            write(match_chunk(chunk))
+    else:
+        torch_threads = max(1, (os.cpu_count() or 1) // args.workers)
+        # spawn: never fork a parent that may already hold torch/OpenMP threads
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(args.workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(torch_threads,)) as pool:
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(pool.submit(match_chunk, chunk))
+                if len(in_flight) >= 2 * args.workers:
+                    write(in_flight.popleft().result())
+            while in_flight:
+                write(in_flight.popleft().result())
+    out.close()
+
+    elapsed = time.perf_counter() - started
+    rate = matched / elapsed if elapsed > 0 else 0.0
+    print(f"Matched {matched} ideas in {elapsed:.1f}s ({rate:.1f} ideas/s) -> {args.out}", file=sys.stderr)
+    print("Tiers: " + ", ".join(f"{t}={n}" for t, n in tiers.most_common()), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
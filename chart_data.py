@@ -0,0 +1,101 @@
+"""Chart datasets served by /api/answer-data/<answer_id>.
+
+Each answer that shows a chart registers a generator returning (x, y) NumPy
+arrays. A dataset is generated once, on first use, and every encoding of it
+(per max_points and format) is cached with its ETag, so requests are served
+from memory and revalidated with If-None-Match.
+
+Large series are downsampled to max_points with Largest-Triangle-Three-Buckets
+(LTTB), which keeps the visual shape (peaks, slopes) of the line.
+
+Formats:
+  - "json": {"x": [...], "y": [...]}
+  - "f32" : little-endian binary, uint32 point count n, then n float32 x values
+            and n float32 y values (8 bytes per point instead of ~40 in JSON)
+"""
+
+import hashlib
+import json
+import struct
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+FORMATS = {"json": "application/json", "f32": "application/octet-stream"}
+# Upper bound for max_points (and the size of the encoding cache key space)
+MAX_POINTS_LIMIT = 10000
+
+_generators: Dict[str, Callable[[], Tuple[np.ndarray, np.ndarray]]] = {}
+_datasets: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+_lock = threading.Lock()
+
+
+def register(answer_id: str):
+    """Decorator registering fn() -> (x, y) as the chart of answer_id."""
+    def decorator(fn):
+        _generators[str(answer_id)] = fn
+        return fn
+    return decorator
+
+
+def has_chart(answer_id: str) -> bool:
+    return answer_id in _generators
+
+
+def dataset(answer_id: str) -> Tuple[np.ndarray, np.ndarray]:
+    """(x, y) arrays of answer_id's chart, generated on first use."""
+    data = _datasets.get(answer_id)
+    if data is None:
+        with _lock:
+            data = _datasets.get(answer_id)
+            if data is None:
+                x, y = _generators[answer_id]()
+                data = _datasets[answer_id] = (np.asarray(x), np.asarray(y, dtype=np.float64))
+    return data
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the n_out points LTTB keeps (first and last always included)."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf = x.astype(np.float64)
+    # inner points are split into n_out - 2 buckets; one point is kept per bucket
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        start, end = edges[b], edges[b + 1]
+        # average of the next bucket (or the last point) is the third triangle vertex
+        nxt_end = edges[b + 2] if b + 2 < len(edges) else n
+        nxt_start = end if b + 2 < len(edges) else n - 1
+        ax, ay = xf[nxt_start:nxt_end].mean(), y[nxt_start:nxt_end].mean()
+        px, py = xf[prev], y[prev]
+        area = np.abs((px - ax) * (y[start:end] - py) - (px - xf[start:end]) * (ay - py))
+        prev = start + int(np.argmax(area))
+        keep[b + 1] = prev
+    return keep
+
+
+@lru_cache(maxsize=256)
+def encoded(answer_id: str, max_points: Optional[int] = None, fmt: str = "json") -> Tuple[bytes, str]:
+    """(body, etag) of answer_id's chart, downsampled to max_points, in format fmt."""
+    x, y = dataset(answer_id)
+    if max_points is not None and max_points < len(x):
+        keep = lttb(x, y, max_points)
+        x, y = x[keep], y[keep]
+    if fmt == "f32":
+        body = struct.pack("<I", len(x)) + x.astype("<f4").tobytes() + y.astype("<f4").tobytes()
+    else:
+        body = json.dumps({"x": x.tolist(), "y": y.tolist()}, separators=(",", ":")).encode("utf-8")
+    return body, hashlib.sha1(body).hexdigest()[:20]
+
+
+@register("3")
+def _diminishing_returns():
+    # result quality vs amount of work: 100 * log10(x) / log10(n), x = 1..n
+    xs = np.arange(1, 1001)
+    return xs, 100.0 * np.log10(xs) / np.log10(len(xs))
@@ -1,23 +1,420 @@
 #!/usr/bin/env python3
 """
 Script to check bidirectional consistency in qa_store.json.
-For each answer, verifies that all linked questions have that answer in their .answers list.
+For each answer, verifies that all linked questions have that answer in their .answers list
+(and the other way round), that links point to existing ids, and reports orphan entries.
+
+The store is streamed one entry at a time and only ids and links are kept: ids are
+interned to integers and links compared as sorted int64 arrays, so memory grows with
+the number of ids and links, not with the size of the file, and nothing is quadratic
+in the number of links of an entry. Transactions of the write-ahead log (qa_wal.py)
+are validated on top of the snapshot.
+
+Each run saves a checkpoint (<store>.check.npz: the normalized link index and the log
+offset it covers). With --incremental, as long as the JSON snapshot is the one the
+checkpoint was made from, only the log transactions written since then (and the
+questions / answers they touch) are validated; a rewritten snapshot is checked in full.
+
+--fix rewrites the store through QuestionAnswerStore.rewrite_snapshot() (atomic, under
+the store lock): one-sided links are linked both ways, dangling references dropped.
+It loads the whole store in memory.
 
 Usage:
-    python check_qa_consistency.py          # Check only
-    python check_qa_consistency.py --fix    # Check and fix errors
+    python check_qa_consistency.py [store_path]    # Check only
+    python check_qa_consistency.py --fix           # Check and fix errors
+    python check_qa_consistency.py --incremental   # Check what changed since the last check
 """
 
 import json
 import os
 import sys
+from array import array
+from json.decoder import WHITESPACE
+from tempfile import NamedTemporaryFile
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from qa_wal import WriteAheadLog
 
 BASE_DIR = os.path.dirname(__file__)
 STORE_PATH = os.path.join(BASE_DIR, "data/qa_store.json")
+# Messages printed per category (all of them are counted)
+MAX_SHOWN = 20
+
+_MASK = (1 << 32) - 1
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Chunked reader handing out whole JSON values with JSONDecoder.raw_decode."""
+
+    def __init__(self, f, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character (not consumed)."""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError("unexpected end of file")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r}, found {self.buf[self.pos:self.pos + 20]!r}")
+        self.pos += 1
+
+    def skip(self, char: str) -> bool:
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # the value continues in the next chunk
+                if not self._fill():
+                    raise
+                continue
+            # a number at the very end of the buffer may continue in the next chunk too
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_entries(path: str, chunk_size: int = 1 << 20) -> Iterator[Tuple[str, str, object]]:
+    """Yield (section, key, value) for every member of the top-level objects of a JSON file."""
+    with open(path, "r", encoding="utf-8") as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("{")
+        if reader.skip("}"):
+            return
+        while True:
+            section = reader.value()
+            reader.expect(":")
+            if reader.skip("{"):
+                if not reader.skip("}"):
+                    while True:
+                        key = reader.value()
+                        reader.expect(":")
+                        yield section, key, reader.value()
+                        if not reader.skip(","):
+                            reader.expect("}")
+                            break
+            else:
+                reader.value()
+            if not reader.skip(","):
+                reader.expect("}")
+                return
+
+
+def snapshot_token(path: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+class Report:
+    def __init__(self):
+        self.errors: List[str] = []
+        self.error_count = 0
+        self.warnings: List[str] = []
+        self.warning_count = 0
+
+    def error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_SHOWN:
+            self.errors.append(message)
+
+    def warning(self, message: str):
+        self.warning_count += 1
+        if len(self.warnings) < MAX_SHOWN:
+            self.warnings.append(message)
+
+    def error_pairs(self, codes: np.ndarray, message: Callable[[int, int], str]):
+        """One error per link code; message(question ordinal, answer ordinal) for the shown ones."""
+        for c in codes[:MAX_SHOWN].tolist():
+            self.error(message(c >> 32, c & _MASK))
+        self.error_count += max(0, len(codes) - MAX_SHOWN)
+
+
+class _Ids:
+    """Ids interned to ordinals; `defined` tells which ones have an entry (others are only referenced)."""
+
+    def __init__(self, ids: Optional[List[str]] = None, defined: Optional[bytearray] = None):
+        self.ids = ids or []
+        self.ordinals: Dict[str, int] = {key: i for i, key in enumerate(self.ids)}
+        self.defined = defined if defined is not None else bytearray(len(self.ids))
+
+    def intern(self, key: str) -> int:
+        ordinal = self.ordinals.get(key)
+        if ordinal is None:
+            ordinal = self.ordinals[key] = len(self.ids)
+            self.ids.append(key)
+            self.defined.append(0)
+        return ordinal
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _swap(codes: np.ndarray) -> np.ndarray:
+    return np.sort(((codes & _MASK) << 32) | (codes >> 32))
+
+
+class LinkIndex:
+    """Questions, answers and the normalized links of a store.
+
+    Links are sorted int64 codes, question ordinal << 32 | answer ordinal in
+    by_question and the reverse in by_answer. Entities changed by log
+    transactions get a set of links in _q_links / _a_links that overrides the
+    arrays until save().
+    """
+
+    def __init__(self, questions: _Ids, answers: _Ids, by_question: np.ndarray, by_answer: np.ndarray,
+                 meta: Optional[dict] = None):
+        self.questions = questions
+        self.answers = answers
+        self.by_question = by_question
+        self.by_answer = by_answer
+        # snapshot token, log offset covered, result of the last full snapshot check
+        self.meta = meta or {}
+        self._q_links: Dict[int, set] = {}
+        self._a_links: Dict[int, set] = {}
+
+    @classmethod
+    def scan(cls, path: str, report: Report) -> "LinkIndex":
+        """Check the JSON snapshot at path in one streaming pass and index it."""
+        token = snapshot_token(path)
+        questions, answers = _Ids(), _Ids()
+        q_side, a_side = array("q"), array("q")
+        orphan_texts: Dict[Tuple[str, int], str] = {}
+        for section, key, entry in iter_entries(path):
+            if section not in ("questions", "answers") or not isinstance(entry, dict):
+                continue
+            is_question = section == "questions"
+            own, other = (questions, answers) if is_question else (answers, questions)
+            ordinal = own.intern(key)
+            if own.defined[ordinal]:
+                report.error(f"{'Question' if is_question else 'Answer'} [{key}] is defined twice")
+            own.defined[ordinal] = 1
+            linked = entry.get("answers" if is_question else "questions") or []
+            if not linked and len(orphan_texts) < 50 * MAX_SHOWN:
+                orphan_texts[(section, ordinal)] = (entry.get("text") or "")[:50]
+            if is_question:
+                q_side.extend((ordinal << 32) | answers.intern(aid) for aid in linked)
+            else:
+                a_side.extend((questions.intern(qid) << 32) | ordinal for qid in linked)
+
+        q_defined = np.frombuffer(bytes(questions.defined), dtype=np.uint8).astype(bool)
+        a_defined = np.frombuffer(bytes(answers.defined), dtype=np.uint8).astype(bool)
+        q_codes = np.unique(np.frombuffer(q_side, dtype=np.int64))
+        a_codes = np.unique(np.frombuffer(a_side, dtype=np.int64))
+        del q_side, a_side
+
+        # Check 1: references to ids that have no entry
+        valid = a_defined[q_codes & _MASK]
+        report.error_pairs(q_codes[~valid], lambda q, a: (
+            f"Question [{questions.ids[q]}] references non-existent answer [{answers.ids[a]}]"))
+        q_codes = q_codes[valid]
+        valid = q_defined[a_codes >> 32]
+        report.error_pairs(a_codes[~valid], lambda q, a: (
+            f"Answer [{answers.ids[a]}] references non-existent question [{questions.ids[q]}]"))
+        a_codes = a_codes[valid]
+
+        # Check 2: links listed on one side only
+        report.error_pairs(np.setdiff1d(a_codes, q_codes, assume_unique=True), lambda q, a: (
+            f"Answer [{answers.ids[a]}] lists question [{questions.ids[q]}] but question doesn't list answer back"))
+        report.error_pairs(np.setdiff1d(q_codes, a_codes, assume_unique=True), lambda q, a: (
+            f"Question [{questions.ids[q]}] lists answer [{answers.ids[a]}] but answer doesn't list question back"))
+
+        # the store links one-sided entries both ways (QAGraph.from_dict): so does the index
+        by_question = np.union1d(q_codes, a_codes)
+        index = cls(questions, answers, by_question, _swap(by_question),
+                    {"snapshot": token, "wal_offset": 0,
+                     "snapshot_errors": report.error_count, "snapshot_messages": list(report.errors)})
+
+        # Check 3: orphans (no link on either side)
+        q_linked = np.bincount(by_question >> 32, minlength=len(questions)) > 0
+        a_linked = np.bincount(index.by_answer >> 32, minlength=len(answers)) > 0
+        for section, ids, orphans in (("questions", questions, q_defined & ~q_linked),
+                                      ("answers", answers, a_defined & ~a_linked)):
+            label, missing = ("Question", "answers") if section == "questions" else ("Answer", "questions")
+            ordinals = np.flatnonzero(orphans)
+            for ordinal in ordinals[:MAX_SHOWN].tolist():
+                report.warning(f"{label} [{ids.ids[ordinal]}] has no {missing}: {orphan_texts.get((section, ordinal), '...')}")
+            report.warning_count += max(0, len(ordinals) - MAX_SHOWN)
+        return index
+
+    # --- checkpoint ---
+
+    @classmethod
+    def load(cls, checkpoint_path: str, store_path: str) -> Optional["LinkIndex"]:
+        """The checkpoint's index, or None if there is none or the snapshot was rewritten since."""
+        try:
+            with np.load(checkpoint_path) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("snapshot") != snapshot_token(store_path):
+                    return None
+                return cls(_Ids(data["question_ids"].tolist(), bytearray(data["question_defined"].tobytes())),
+                           _Ids(data["answer_ids"].tolist(), bytearray(data["answer_defined"].tobytes())),
+                           data["by_question"], data["by_answer"], meta)
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def fold(self):
+        """Merge the links changed by log transactions into the arrays."""
+        self.by_question = self._merged(self.by_question, self._q_links)
+        self.by_answer = self._merged(self.by_answer, self._a_links)
+        self._q_links, self._a_links = {}, {}
+
+    def save(self, checkpoint_path: str):
+        """Write the index (log changes folded in) atomically to checkpoint_path."""
+        self.fold()
+        dirpath = os.path.dirname(os.path.abspath(checkpoint_path)) or "."
+        with NamedTemporaryFile(dir=dirpath, suffix=".npz", delete=False) as tf:
+            np.savez(tf, meta=np.array(json.dumps(self.meta)),
+                     question_ids=np.array(self.questions.ids, dtype=str),
+                     question_defined=np.frombuffer(bytes(self.questions.defined), dtype=np.uint8),
+                     answer_ids=np.array(self.answers.ids, dtype=str),
+                     answer_defined=np.frombuffer(bytes(self.answers.defined), dtype=np.uint8),
+                     by_question=self.by_question, by_answer=self.by_answer)
+            tmpname = tf.name
+        os.replace(tmpname, checkpoint_path)
+
+    @staticmethod
+    def _merged(codes: np.ndarray, overrides: Dict[int, set]) -> np.ndarray:
+        if not overrides:
+            return codes
+        changed = np.fromiter(overrides, dtype=np.int64)
+        kept = codes[~np.isin(codes >> 32, changed)]
+        added = np.fromiter(((k << 32) | v for k, links in overrides.items() for v in links), dtype=np.int64)
+        return np.union1d(kept, added)
+
+    # --- write-ahead log ---
+
+    def _links(self, overrides: Dict[int, set], codes: np.ndarray, ordinal: int) -> set:
+        links = overrides.get(ordinal)
+        if links is None:
+            lo, hi = np.searchsorted(codes, [ordinal << 32, (ordinal + 1) << 32])
+            links = overrides[ordinal] = set((codes[lo:hi] & _MASK).tolist())
+        return links
+
+    def _question_links(self, q: int) -> set:
+        return self._links(self._q_links, self.by_question, q)
+
+    def _answer_links(self, a: int) -> set:
+        return self._links(self._a_links, self.by_answer, a)
+
+    def apply_log(self, wal: WriteAheadLog, report: Report) -> int:
+        """Validate and apply the log transactions after meta["wal_offset"]; returns how many."""
+        offset = self.meta.get("wal_offset", 0)
+        if wal.size() < offset:
+            raise ValueError("the write-ahead log is shorter than at the last check")
+        touched_q, touched_a = set(), set()
+        count = 0
+        for records, end in wal.read_from(offset):
+            count += 1
+            for record in records:
+                op = record.get("op")
+                if op in ("add_question", "add_answer"):
+                    is_question = op == "add_question"
+                    own = self.questions if is_question else self.answers
+                    ordinal = own.intern(record.get("question_id" if is_question else "answer_id"))
+                    # re-adding an id replaces the entry and drops its links, as QAGraph does
+                    if own.defined[ordinal]:
+                        links = self._question_links(ordinal) if is_question else self._answer_links(ordinal)
+                        for other in links:
+                            (self._answer_links(other) if is_question else self._question_links(other)).discard(ordinal)
+                            (touched_a if is_question else touched_q).add(other)
+                        links.clear()
+                    own.defined[ordinal] = 1
+                    (touched_q if is_question else touched_a).add(ordinal)
+                elif op in ("link", "remove_link"):
+                    qid, aid = record.get("question_id"), record.get("answer_id")
+                    q, a = self.questions.ordinals.get(qid), self.answers.ordinals.get(aid)
+                    known = q is not None and self.questions.defined[q] and a is not None and self.answers.defined[a]
+                    if not known:
+                        if op == "link":
+                            report.error(f"Log transaction at byte {offset} links unknown answer [{aid}] "
+                                         f"to question [{qid}]")
+                        continue
+                    if op == "link":
+                        self._question_links(q).add(a)
+                        self._answer_links(a).add(q)
+                    else:
+                        self._question_links(q).discard(a)
+                        self._answer_links(a).discard(q)
+                    touched_q.add(q)
+                    touched_a.add(a)
+                else:
+                    report.error(f"Log transaction at byte {offset} has an unknown operation: {op}")
+            offset = end
+        self.meta["wal_offset"] = offset
+        for q in sorted(touched_q):
+            if not self._question_links(q):
+                report.warning(f"Question [{self.questions.ids[q]}] has no answers")
+        for a in sorted(touched_a):
+            if not self._answer_links(a):
+                report.warning(f"Answer [{self.answers.ids[a]}] has no questions")
+        return count
+
+    def counts(self) -> Tuple[int, int, int]:
+        """(questions, answers, links)."""
+        self.fold()
+        return sum(self.questions.defined), sum(self.answers.defined), len(self.by_question)
+
+
+def check(path: str, incremental: bool, report: Report) -> Tuple[LinkIndex, str, int]:
+    """(index, "full" or "incremental", log transactions validated)."""
+    checkpoint_path = path + ".check.npz"
+    wal = WriteAheadLog(path + ".wal")
+    index = LinkIndex.load(checkpoint_path, path) if incremental else None
+    mode = "incremental"
+    transactions = None
+    if index is not None:
+        try:
+            transactions = index.apply_log(wal, report)
+        except ValueError as e:
+            print(f"Checkpoint not usable ({e}): full check")
+    if transactions is None:
+        mode = "full"
+        index = LinkIndex.scan(path, report)
+        transactions = index.apply_log(wal, report)
+    if snapshot_token(path) == index.meta["snapshot"]:
+        index.save(checkpoint_path)
+    else:
+        print("The snapshot changed during the check: checkpoint not saved")
+    return index, mode, transactions
 
 
 def main():
     fix_mode = '--fix' in sys.argv
+    incremental = '--incremental' in sys.argv
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    store_path = args[0] if args else STORE_PATH
 
     print("=" * 60)
     print("QA Store Bidirectional Consistency Check")
@@ -28,125 +425,62 @@ def main():
     print("=" * 60)
 
     # Load the store
-    if not os.path.exists(STORE_PATH):
-        print(f"ERROR: {STORE_PATH} not found!")
+    if not os.path.exists(store_path):
+        print(f"ERROR: {store_path} not found!")
         return
 
-    with open(STORE_PATH, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-
-    questions = data.get('questions', {})
-    answers = data.get('answers', {})
-
-    print(f"Loaded {len(questions)} questions and {len(answers)} answers\n")
-
-    errors = []
-    warnings = []
-
-    fixes_made = 0
-
-    # Check 1: For each answer, verify its linked questions have the answer back-linked
-    print("Checking: answer.questions -> question.answers...")
-    for aid, answer in answers.items():
-        answer_text = answer.get('text', '')[:50]
-        linked_questions = answer.get('questions', [])
-
-        for qid in linked_questions:
-            if qid not in questions:
-                errors.append(f"Answer [{aid}] references non-existent question [{qid}]")
-                continue
-
-            question = questions[qid]
-            question_answers = question.get('answers', [])
-
-            if aid not in question_answers:
-                errors.append(
-                    f"Answer [{aid}] lists question [{qid}] but question doesn't list answer back\n"
-                    f"  Answer: {answer_text}...\n"
-                    f"  Question: {question.get('text', '')}"
-                )
-                if fix_mode:
-                    if 'answers' not in question:
-                        question['answers'] = []
-                    question['answers'].append(aid)
-                    fixes_made += 1
-                    print(f"  FIXED: Added answer [{aid}] to question [{qid}].answers")
-
-    # Check 2: For each question, verify its linked answers have the question back-linked
-    print("Checking: question.answers -> answer.questions...")
-    for qid, question in questions.items():
-        question_text = question.get('text', '')
-        linked_answers = question.get('answers', [])
-
-        for aid in linked_answers:
-            if aid not in answers:
-                errors.append(f"Question [{qid}] references non-existent answer [{aid}]")
-                continue
-
-            answer = answers[aid]
-            answer_questions = answer.get('questions', [])
-
-            if qid not in answer_questions:
-                errors.append(
-                    f"Question [{qid}] lists answer [{aid}] but answer doesn't list question back\n"
-                    f"  Question: {question_text}\n"
-                    f"  Answer: {answer.get('text', '')[:50]}..."
-                )
-                if fix_mode:
-                    if 'questions' not in answer:
-                        answer['questions'] = []
-                    answer['questions'].append(qid)
-                    fixes_made += 1
-                    print(f"  FIXED: Added question [{qid}] to answer [{aid}].questions")
-
-    # Check 3: Find orphan questions (no answers)
-    print("Checking: orphan questions (no answers)...")
-    for qid, question in questions.items():
-        if not question.get('answers'):
-            warnings.append(f"Question [{qid}] has no answers: {question.get('text', '')}")
-
-    # Check 4: Find orphan answers (no questions)
-    print("Checking: orphan answers (no questions)...")
-    for aid, answer in answers.items():
-        if not answer.get('questions'):
-            warnings.append(f"Answer [{aid}] has no questions: {answer.get('text', '')[:50]}...")
+    report = Report()
+    index, mode, transactions = check(store_path, incremental, report)
+    if mode == "incremental":
+        snapshot_errors = index.meta.get("snapshot_errors", 0)
+        print(f"Snapshot unchanged since the last check ({snapshot_errors} errors in it); "
+              f"validated {transactions} new log transactions")
+        for message in index.meta.get("snapshot_messages", []):
+            report.errors.append(f"{message} (snapshot, last full check)")
+        report.error_count += snapshot_errors
+    else:
+        print(f"Checked the snapshot and {transactions} log transactions")
+    n_questions, n_answers, n_links = index.counts()
 
     # Report results
     print("\n" + "=" * 60)
     print("RESULTS")
     print("=" * 60)
 
-    if errors:
-        print(f"\n❌ ERRORS ({len(errors)}):")
-        for err in errors:
+    if report.error_count:
+        print(f"\n❌ ERRORS ({report.error_count}):")
+        for err in report.errors:
             print(f"  - {err}")
+        if report.error_count > len(report.errors):
+            print(f"  ... and {report.error_count - len(report.errors)} more errors")
     else:
         print("\n✓ No bidirectional link errors found!")
 
-    if warnings:
-        print(f"\n⚠️  WARNINGS ({len(warnings)}):")
-        for warn in warnings[:20]:  # Limit display
+    if report.warning_count:
+        print(f"\n⚠️  WARNINGS ({report.warning_count}):")
+        for warn in report.warnings:
             print(f"  - {warn}")
-        if len(warnings) > 20:
-            print(f"  ... and {len(warnings) - 20} more warnings")
+        if report.warning_count > len(report.warnings):
+            print(f"  ... and {report.warning_count - len(report.warnings)} more warnings")
     else:
         print("\n✓ No orphan entries found!")
 
     print(f"\nSummary:")
-    print(f"  Total questions: {len(questions)}")
-    print(f"  Total answers: {len(answers)}")
-    print(f"  Errors: {len(errors)}")
-    print(f"  Warnings: {len(warnings)}")
-    print(f"  Fixes made: {fixes_made}")
-
-    # Save if fixes were made
-    if fix_mode and fixes_made > 0:
-        print(f"\nSaving {fixes_made} fixes to {STORE_PATH}...")
-        with open(STORE_PATH, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"  Total questions: {n_questions}")
+    print(f"  Total answers: {n_answers}")
+    print(f"  Total links: {n_links}")
+    print(f"  Errors: {report.error_count}")
+    print(f"  Warnings: {report.warning_count}")
+
+    # Save if fixes are needed
+    if fix_mode and report.error_count:
+        from qa_store import QuestionAnswerStore
+
+        print(f"\nRewriting {store_path}...")
+        QuestionAnswerStore(store_path).rewrite_snapshot()
         print("✓ Saved!")
 
-    return len(errors) == 0
+    return report.error_count == 0
 
 
 if __name__ == "__main__":
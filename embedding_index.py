@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Persistent on-disk cache of the SBERT question embeddings used by app.py.
+
+The artifact lives next to the QA store and is made of two files:
+  - <store>.embeddings.npy  : L2-normalized float32 (or float16) matrix, one row per question
+  - <store>.embeddings.json : manifest {"model", "dim", "dtype", "ids", "hashes"}
+
+Each row is keyed by the question id and a hash of the text that was encoded,
+so on startup only questions that were added or edited are re-encoded. The
+matrix is opened read-only with mmap, so all gunicorn workers share one copy.
+
+Usage:
+    python embedding_index.py                  # build / refresh the artifact for data/qa_store.json
+    python embedding_index.py path/to/store.json
+    python embedding_index.py --force          # re-encode every question
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import sys
+from contextlib import contextmanager
+from tempfile import NamedTemporaryFile
+from typing import Callable, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+DEFAULT_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+MODEL_NAME = os.environ.get("SBERT_MODEL_NAME", DEFAULT_MODEL_NAME)
+# float16 halves the shared matrix size at a negligible cost in score precision
+EMBEDDINGS_DTYPE = os.environ.get("EMBEDDINGS_DTYPE", "float32")
+
+BASE_DIR = os.path.dirname(__file__)
+# same store selection as app.py
+STORE_PATH = os.environ.get("QA_STORE_PATH") or os.path.join(
+    BASE_DIR, "data/qa_store.sqlite3" if os.environ.get("QA_STORE_BACKEND") == "sqlite" else "data/qa_store.json")
+
+
+def question_corpus(questions: Iterable[Tuple[str, dict]]) -> Tuple[List[str], List[str]]:
+    """Return (ids, texts) from (qid, question) pairs; each text combines question text and description."""
+    ids = []
+    texts = []
+    for qid, qobj in questions:
+        ids.append(qid)
+        # Combine text and description for richer semantic matching
+        text = (qobj.get('text') or '').strip()
+        desc = (qobj.get('description') or '').strip()
+        texts.append(f"{text}. {desc}" if desc else text)
+    return ids, texts
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def artifact_paths(store_path: str) -> Tuple[str, str]:
+    """Return (manifest_path, vectors_path) for the store at store_path."""
+    base, _ext = os.path.splitext(store_path)
+    return base + '.embeddings.json', base + '.embeddings.npy'
+
+
+@contextmanager
+def artifact_lock(store_path: str):
+    """Exclusive lock on the store's artifact (<store>.embeddings.lock), across processes.
+
+    Held while refreshing the artifact, so that when several workers notice the
+    same store change, the first one encodes and writes the new rows and the
+    others find the artifact already up to date. On a read-only filesystem the
+    lock file cannot be created; the artifact cannot be written either, so each
+    worker goes on unlocked with its private copy (see load_embeddings).
+    """
+    path = os.path.splitext(store_path)[0] + '.embeddings.lock'
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)) or ".", exist_ok=True)
+        f = open(path, 'a')
+    except OSError:
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _atomic_write(path: str, write: Callable, mode: str = 'w'):
+    dirpath = os.path.dirname(os.path.abspath(path)) or "."
+    os.makedirs(dirpath, exist_ok=True)
+    kwargs = {'encoding': 'utf-8'} if 'b' not in mode else {}
+    with NamedTemporaryFile(mode, dir=dirpath, delete=False, **kwargs) as tf:
+        write(tf)
+        tmpname = tf.name
+    os.replace(tmpname, path)
+
+
+def _read_artifact(store_path: str, model_name: str):
+    """Return (manifest, memory-mapped vectors), or (None, None) if missing/unusable."""
+    manifest_path, vectors_path = artifact_paths(store_path)
+    if not (os.path.exists(manifest_path) and os.path.exists(vectors_path)):
+        return None, None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode='r')
+    except Exception:
+        return None, None
+    # A manifest for another model, or one that does not match the matrix
+    # (e.g. a concurrent writer replaced only one of the two files), is ignored.
+    if (manifest.get('model') != model_name or not manifest.get('normalized')
+            or vectors.ndim != 2 or vectors.shape[0] != len(manifest.get('hashes', []))):
+        return None, None
+    return manifest, vectors
+
+
+def _write_artifact(store_path: str, model_name: str, ids: Sequence[str], hashes: Sequence[str], vectors: np.ndarray):
+    manifest_path, vectors_path = artifact_paths(store_path)
+    # vectors first: readers validate the manifest against the matrix shape
+    _atomic_write(vectors_path, lambda f: np.save(f, vectors), mode='wb')
+    manifest = {'model': model_name, 'dim': int(vectors.shape[1]), 'dtype': vectors.dtype.name,
+                'normalized': True, 'ids': list(ids), 'hashes': list(hashes)}
+    _atomic_write(manifest_path, lambda f: json.dump(manifest, f, ensure_ascii=False))
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so that cosine similarity becomes a plain dot product."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def load_embeddings(store_path: str, model_name: str, ids: Sequence[str], texts: Sequence[str],
+                    encode: Callable[[List[str]], np.ndarray], persist: bool = True,
+                    force: bool = False, dtype: str = 'float32') -> Tuple[np.ndarray, int]:
+    """Return (normalized matrix aligned with ids, number of re-encoded texts).
+
+    Rows whose text hash is already in the on-disk artifact are reused; the others
+    are passed to encode() in a single call. The artifact is rewritten only if
+    something changed. When it is up to date, the returned matrix is a read-only
+    memory map of the artifact, so every process that opens it shares the same
+    page-cache pages instead of holding its own copy.
+    """
+    hashes = [content_hash(t) for t in texts]
+    manifest, cached = (None, None) if force else _read_artifact(store_path, model_name)
+    if (manifest is not None and manifest['hashes'] == hashes and manifest.get('ids') == list(ids)
+            and cached.dtype == np.dtype(dtype)):
+        return cached, 0
+
+    known = {h: row for row, h in enumerate(manifest['hashes'])} if manifest else {}
+    missing = [i for i, h in enumerate(hashes) if h not in known]
+    fresh = None
+    if missing:
+        fresh = normalize_rows(encode([texts[i] for i in missing]))
+
+    dim = fresh.shape[1] if fresh is not None else (cached.shape[1] if cached is not None else 0)
+    matrix = np.empty((len(ids), dim), dtype=dtype)
+    if missing:
+        matrix[missing] = fresh
+    reused = [i for i, h in enumerate(hashes) if h in known]
+    if reused:
+        matrix[reused] = cached[[known[hashes[i]] for i in reused]]
+
+    if persist and ids:
+        try:
+            _write_artifact(store_path, model_name, ids, hashes, matrix)
+        except OSError:
+            # read-only deployment: keep serving from the private in-memory copy
+            return matrix, len(missing)
+        _manifest, shared = _read_artifact(store_path, model_name)
+        if shared is not None and shared.shape == matrix.shape:
+            return shared, len(missing)
+    return matrix, len(missing)
+
+
+def score(matrix: np.ndarray, query: np.ndarray, block_rows: int = 65536) -> np.ndarray:
+    """Cosine scores of normalized queries against a normalized (possibly mmapped) matrix.
+
+    query is one vector (returns shape (N,)) or a (B, dim) batch (returns (N, B)).
+    float16 matrices are upcast block by block so that a query never materializes
+    a full float32 copy of the shared matrix.
+    """
+    qt = np.asarray(query, dtype=np.float32).T
+    if matrix.dtype == np.float32:
+        return matrix @ qt
+    out = np.empty((matrix.shape[0],) + qt.shape[1:], dtype=np.float32)
+    for start in range(0, matrix.shape[0], block_rows):
+        block = matrix[start:start + block_rows]
+        out[start:start + block.shape[0]] = block.astype(np.float32) @ qt
+    return out
+
+
+def main(argv):
+    from qa_store import open_store
+
+    force = '--force' in argv
+    paths = [a for a in argv[1:] if not a.startswith('--')]
+    store_path = paths[0] if paths else STORE_PATH
+    store = open_store(store_path)
+    ids, texts = question_corpus(store.iter_questions())
+    model = None
+
+    def encode(batch):
+        nonlocal model
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(MODEL_NAME)
+        return model.encode(batch, convert_to_numpy=True, show_progress_bar=False)
+
+    matrix, encoded = load_embeddings(store_path, MODEL_NAME, ids, texts, encode, force=force,
+                                      dtype=EMBEDDINGS_DTYPE)
+    print(f"Embeddings for {len(ids)} questions ({encoded} encoded) -> {artifact_paths(store_path)[1]}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
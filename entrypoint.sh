@@ -1,6 +1,16 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
+# Refresh the shared embeddings artifact once, before forking workers, so that
+# every gunicorn worker memory-maps the same up-to-date matrix instead of
+# encoding (and holding) its own copy. Set EMBEDDINGS_DTYPE=float16 to halve it.
+python embedding_index.py
 
-# Start production WSGI server
-exec gunicorn -b 0.0.0.0:5000 app:app
\ No newline at end of file
+# Workers share their /metrics samples through per-pid files in METRICS_DIR;
+# start from an empty directory so counters begin at zero with this server.
+export METRICS_DIR="${METRICS_DIR:-/tmp/doyoureallyneedai-metrics}"
+rm -rf "$METRICS_DIR" && mkdir -p "$METRICS_DIR"
+
+# Start production WSGI server (worker count: WEB_CONCURRENCY, read by gunicorn).
+# Threads let concurrent searches in a worker share one batched encode call.
+exec gunicorn -b 0.0.0.0:5000 --threads "${GUNICORN_THREADS:-4}" app:app
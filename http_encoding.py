@@ -0,0 +1,125 @@
+"""Response compression and conditional requests (ETag / If-None-Match).
+
+    not_modified(request, etag)                  # 304 response, or None
+    encoded_response(request, body, mimetype, etag)
+
+Bodies of at least COMPRESS_MIN_BYTES are sent gzip-compressed (or brotli when
+the optional `brotli` package is installed and the client accepts "br"), with
+"Vary: Accept-Encoding". etag identifies the uncompressed body; each encoding
+is a different representation and gets its own strong tag ("<etag>-gzip",
+"<etag>-br"), while If-None-Match matches any of them. Compressed bodies of
+tagged responses are memoized by (etag, encoding), so repeat traffic is
+compressed once.
+"""
+
+import gzip
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Response
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))
+# Budget of the memo of compressed bodies, in bytes
+COMPRESSED_CACHE_MAX_BYTES = int(os.environ.get("COMPRESSED_CACHE_MAX_BYTES", str(8 << 20)))
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+RESPONSE_BYTES = metrics.Counter("http_response_body_bytes_total",
+                                 "Response body bytes sent by compressible endpoints", labelnames=("encoding",))
+NOT_MODIFIED = metrics.Counter("http_not_modified_total", "Requests answered 304 Not Modified")
+
+_memo: "OrderedDict[tuple, bytes]" = OrderedDict()
+_memo_bytes = 0
+_memo_lock = threading.Lock()
+
+
+def _negotiate(request) -> Optional[str]:
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def _tag(etag: str, encoding: Optional[str]) -> str:
+    return f"{etag}-{encoding}" if encoding else etag
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0: the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _compressed(body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+    global _memo_bytes
+    if etag is None:
+        return _compress(body, encoding)
+    key = (etag, encoding)
+    with _memo_lock:
+        data = _memo.get(key)
+        if data is not None:
+            _memo.move_to_end(key)
+            return data
+    data = _compress(body, encoding)
+    if len(data) <= COMPRESSED_CACHE_MAX_BYTES:
+        with _memo_lock:
+            if key not in _memo:
+                _memo[key] = data
+                _memo_bytes += len(data)
+                while _memo_bytes > COMPRESSED_CACHE_MAX_BYTES:
+                    _key, evicted = _memo.popitem(last=False)
+                    _memo_bytes -= len(evicted)
+    return data
+
+
+def not_modified(request, etag: str) -> Optional[Response]:
+    """A 304 response if the client's If-None-Match holds any representation of etag.
+
+    The 304 carries the tag that matched: whether the 200 would be compressed
+    depends on the body size, unknown here, and the representation the client
+    validated is the one it holds.
+    """
+    inm = request.if_none_match
+    if not inm:
+        return None
+    # the negotiated encoding first (If-None-Match: * matches all of them)
+    preferred = _negotiate(request)
+    encodings = sorted((None,) + ENCODINGS, key=lambda e: e != preferred)
+    matched = next((tag for tag in (_tag(etag, e) for e in encodings) if inm.contains_weak(tag)), None)
+    if matched is None:
+        return None
+    NOT_MODIFIED.inc()
+    response = Response(status=304)
+    response.set_etag(matched)
+    response.cache_control.no_cache = True
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def encoded_response(request, body: bytes, mimetype: str, etag: Optional[str] = None) -> Response:
+    """Response for body, compressed when large enough and accepted by the client.
+
+    With an etag the response also carries a strong ETag and "Cache-Control:
+    no-cache", so clients revalidate and get a 304 while etag is unchanged.
+    """
+    encoding = _negotiate(request) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding is not None:
+        body = _compressed(body, encoding, etag)
+    response = Response(body, mimetype=mimetype)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if etag is not None:
+        response.set_etag(_tag(etag, encoding))
+        response.cache_control.no_cache = True
+    RESPONSE_BYTES.inc(len(body), encoding=encoding or "identity")
+    return response
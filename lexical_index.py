@@ -0,0 +1,113 @@
+"""Character n-gram TF-IDF index: the fast lexical tier of /api/search.
+
+Question text and description are vectorized into L2-normalized char n-gram
+TF-IDF vectors (n-grams within word boundaries), so typos, missing accents and
+word-order changes still score high. A query costs one sparse transform and one
+sparse product, well under a millisecond on our corpus sizes, instead of an
+SBERT forward pass.
+"""
+
+import threading
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+# add() stacks new rows onto a small tail matrix, merged into the main one once it
+# holds more than max(TAIL_MIN_ROWS, TAIL_ROWS_PER_SQRT * sqrt(main rows)) rows
+TAIL_MIN_ROWS = 256
+TAIL_ROWS_PER_SQRT = 4
+
+
+class LexicalIndex:
+    def __init__(self, items: Iterable[Tuple[str, str]], ngram_range: Tuple[int, int] = (2, 4)):
+        """items: (key, text) pairs, e.g. question ids and "text. description"."""
+        items = list(items)
+        self._lock = threading.Lock()
+        self._vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=ngram_range,
+                                           lowercase=True, strip_accents="unicode", sublinear_tf=True)
+        matrix = self._vectorizer.fit_transform([text for _key, text in items]).tocsr() if items else None
+        keys = [key for key, _text in items]
+        # (matrix, keys, tail, tail_keys, dead) are swapped together so a search never
+        # sees a half-applied add: rows added since the last merge are in tail, and
+        # main-matrix rows replaced by a re-index are listed in dead (scored 0)
+        self._state = (matrix, keys, None, [], np.empty(0, dtype=np.intp))
+        # key -> row (tail rows are numbered after the main matrix)
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, key: str, text: str):
+        """Index (or re-index) a text with the existing vocabulary (n-grams never seen are ignored).
+
+        Amortized cost: the new row is stacked onto the small tail matrix only;
+        the main matrix is copied when the tail is merged into it.
+        """
+        if self._state[0] is None:
+            return
+        row = self._vectorizer.transform([text])
+        with self._lock:
+            # copy-on-write: concurrent searches keep using the previous state
+            matrix, keys, tail, tail_keys, dead = self._state
+            i = self._rows.get(key)
+            if i is not None and i >= len(keys):
+                j = i - len(keys)
+                tail = sp.vstack([tail[:j], row, tail[j + 1:]], format="csr")
+            else:
+                if i is not None:
+                    dead = np.append(dead, i)
+                self._rows[key] = len(keys) + len(tail_keys)
+                tail = row.tocsr() if tail is None else sp.vstack([tail, row], format="csr")
+                tail_keys = tail_keys + [key]
+            if len(tail_keys) > max(TAIL_MIN_ROWS, int(TAIL_ROWS_PER_SQRT * len(keys) ** 0.5)):
+                live = np.ones(matrix.shape[0], dtype=bool)
+                live[dead] = False
+                matrix = sp.vstack([matrix[live] if len(dead) else matrix, tail], format="csr")
+                keys = [k for k, keep in zip(keys, live) if keep] + tail_keys
+                tail, tail_keys, dead = None, [], np.empty(0, dtype=np.intp)
+                self._rows = {k: i for i, k in enumerate(keys)}
+            self._state = (matrix, keys, tail, tail_keys, dead)
+
+    def _scores(self, state, queries: List[str]) -> np.ndarray:
+        """(rows, len(queries)) cosine scores against the main matrix, then the tail."""
+        matrix, _keys, tail, _tail_keys, dead = state
+        vectors = self._vectorizer.transform(queries).T
+        scores = (matrix @ vectors).toarray()
+        if tail is not None:
+            scores = np.vstack([scores, (tail @ vectors).toarray()])
+        if len(dead):
+            scores[dead] = 0
+        return scores
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to top_k (key, cosine score) pairs, best first, with score > 0."""
+        state = self._state
+        if state[0] is None or not query.strip():
+            return []
+        return self._top(self._scores(state, [query])[:, 0], state, top_k)
+
+    def search_batch(self, queries: List[str], top_k: int = 5, chunk: int = 256) -> List[List[Tuple[str, float]]]:
+        """search() for many queries: one transform and one sparse product per chunk."""
+        state = self._state
+        if state[0] is None:
+            return [[] for _q in queries]
+        results = []
+        for start in range(0, len(queries), chunk):
+            part = queries[start:start + chunk]
+            scores = self._scores(state, part)
+            for col, query in enumerate(part):
+                results.append(self._top(scores[:, col], state, top_k) if query.strip() else [])
+        return results
+
+    @staticmethod
+    def _top(scores: np.ndarray, state, top_k: int) -> List[Tuple[str, float]]:
+        _matrix, keys, _tail, tail_keys, _dead = state
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return []
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        n = len(keys)
+        return [(keys[i] if i < n else tail_keys[i - n], float(scores[i])) for i in idx if scores[i] > 0]
@@ -0,0 +1,226 @@
+"""Minimal Prometheus-style counters and histograms (text exposition format).
+
+    SEARCH_STAGE = Histogram("search_stage_seconds", "...", labelnames=("stage",))
+    with SEARCH_STAGE.time(stage="substring"):
+        ...
+    render()  # -> text for GET /metrics
+
+METRICS_ENABLED=0 turns every inc/observe/time into a flag check.
+
+Under gunicorn each worker only sees its own requests. When METRICS_DIR is set
+(entrypoint.sh points it to a fresh directory), every worker writes a snapshot
+of its metrics to METRICS_DIR/<pid>.json at most every FLUSH_INTERVAL seconds
+and render() sums the snapshots of all workers, so any worker answers /metrics
+for the whole server. Snapshots of exited workers are kept, as counters must
+never go down.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from typing import Dict, List, Sequence, Tuple
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+METRICS_DIR = os.environ.get("METRICS_DIR") or None
+FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1.0"))
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(11))  # 1 KiB .. 1 GiB
+
+_NULL = nullcontext()
+_registry: List["_Metric"] = []
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._pid = os.getpid()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple([str(labels.get(name, "")) for name in self.labelnames])
+
+    def _slot(self, key: Tuple[str, ...]) -> list:
+        if self._pid != os.getpid():
+            # forked child: the parent's samples stay in the parent's snapshot
+            self._values = {}
+            self._pid = os.getpid()
+        slot = self._values.get(key)
+        if slot is None:
+            slot = self._values[key] = self._empty()
+        return slot
+
+    def _empty(self) -> list:
+        raise NotImplementedError
+
+    def snapshot(self) -> List[list]:
+        with self._lock:
+            return [[list(key), list(values)] for key, values in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _empty(self) -> list:
+        return [0.0]
+
+    def inc(self, amount: float = 1.0, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._slot(key)[0] += amount
+        _maybe_flush()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _empty(self) -> list:
+        # one count per bucket (non-cumulative), then +Inf, then the sum
+        return [0.0] * (len(self.buckets) + 2)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            slot = self._slot(key)
+            slot[i] += 1
+            slot[-1] += value
+        _maybe_flush()
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block, in seconds."""
+        if not METRICS_ENABLED:
+            return _NULL
+        return _Timer(self, labels)
+
+
+class _Timer:
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+def _snapshot() -> Dict[str, List[list]]:
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+
+def flush():
+    """Write this worker's snapshot to METRICS_DIR/<pid>.json (atomically)."""
+    global _last_flush
+    if not METRICS_DIR:
+        return
+    with _flush_lock:
+        _last_flush = time.monotonic()
+        path = os.path.join(METRICS_DIR, "%d.json" % os.getpid())
+        tmp = path + ".tmp"
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(_snapshot(), f)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+
+def _maybe_flush():
+    if METRICS_DIR and time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def _collect() -> Dict[str, Dict[Tuple[str, ...], list]]:
+    """Sum of all workers' samples (only this process' when METRICS_DIR is unset)."""
+    snapshots = []
+    if METRICS_DIR:
+        flush()
+        try:
+            names = [n for n in os.listdir(METRICS_DIR) if n.endswith(".json")]
+        except OSError:
+            names = []
+        for name in names:
+            try:
+                with open(os.path.join(METRICS_DIR, name), "r", encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    else:
+        snapshots.append(_snapshot())
+    totals: Dict[str, Dict[Tuple[str, ...], list]] = {}
+    for snapshot in snapshots:
+        for metric_name, samples in snapshot.items():
+            merged = totals.setdefault(metric_name, {})
+            for key, values in samples:
+                current = merged.setdefault(tuple(key), [0.0] * len(values))
+                if len(current) == len(values):
+                    merged[tuple(key)] = [a + b for a, b in zip(current, values)]
+    return totals
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = ['%s="%s"' % (n, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+             for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format (0.0.4)."""
+    totals = _collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, values in sorted(totals.get(metric.name, {}).items()):
+            if metric.kind == "counter":
+                lines.append(f"{metric.name}{_labels(metric.labelnames, key)} {_num(values[0])}")
+                continue
+            cumulative = 0.0
+            for bound, count in zip(metric.buckets, values):
+                cumulative += count
+                le = 'le="%s"' % _num(bound)
+                lines.append(f"{metric.name}_bucket{_labels(metric.labelnames, key, le)} {_num(cumulative)}")
+            cumulative += values[len(metric.buckets)]
+            inf = 'le="+Inf"'
+            lines.append(f"{metric.name}_bucket{_labels(metric.labelnames, key, inf)} {_num(cumulative)}")
+            lines.append(f"{metric.name}_sum{_labels(metric.labelnames, key)} {_num(values[-1])}")
+            lines.append(f"{metric.name}_count{_labels(metric.labelnames, key)} {_num(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+
+if METRICS_ENABLED and METRICS_DIR:
+    atexit.register(flush)
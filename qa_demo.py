@@ -4,16 +4,18 @@ def main():
     store = QuestionAnswerStore("data/qa_store.json")
 
     # If the example file is empty, populate a few entries (idempotent-ish)
-    if not store._data["questions"] and not store._data["answers"]:
-        q1 = store.add_question("Comment utiliser l'IA pour automatiser les e-mails ?")
-        q2 = store.add_question("Idée simple d'IA pour un commerçant local ?")
-        a1 = store.add_answer("Générer des réponses modèles pour les demandes fréquentes.", [q1])
-        a2 = store.add_answer("Analyser les avis et suggérer réponses personnalisées.", [q1, q2])
+    if not store.question_count() and not store.answer_count():
+        # batch(): a single atomic write for the whole bulk insert
+        with store.batch():
+            q1 = store.add_question("Comment utiliser l'IA pour automatiser les e-mails ?")
+            q2 = store.add_question("Idée simple d'IA pour un commerçant local ?")
+            a1 = store.add_answer("Générer des réponses modèles pour les demandes fréquentes.", [q1])
+            a2 = store.add_answer("Analyser les avis et suggérer réponses personnalisées.", [q1, q2])
         print(f"Created questions: {q1}, {q2}")
         print(f"Created answers: {a1}, {a2}")
 
     # Display answers for each question
-    for qid, q in store._data["questions"].items():
+    for qid, q in store.iter_questions():
         print("Question:", q["text"])
         answers = store.get_answers_for_question(qid)
         for a in answers:
@@ -21,7 +23,7 @@ def main():
 
     # Example: add a new answer and link it to both questions
     new_a = store.add_answer("Extraire les mots-clés des messages clients.")
-    store.add_answer_to_questions(new_a, list(store._data["questions"].keys()))
+    store.add_answer_to_questions(new_a, [qid for qid, _q in store.iter_questions()])
     print("Added new answer and linked to all questions:\n", new_a)
 
     # Show questions for the newly added answer
@@ -1,16 +1,227 @@
+"""Question / answer models and QAGraph, the in-memory layout of QuestionAnswerStore.
+
+QAGraph interns ids: every question and answer gets an integer ordinal (its
+position in a list), and each link is kept on both sides as a key of an
+insertion-ordered dict of ordinals. Link, unlink and membership tests are O(1)
+and links keep their order. Models use __slots__, so an entry is one small
+object instead of a dict holding a list of id strings.
+
+The dict-shaped JSON stays the interchange format (from_dict / to_dict):
+{
+  "questions": { "qid": {"text": "...", "description": "...", "answers": [aid, ...]}, ...},
+  "answers":   { "aid": {"text": "...", "questions": [qid, ...]}, ...}
+}
+"""
+
 from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
 import uuid
 
-@dataclass
+
+@dataclass(slots=True)
 class Question:
     """Simple Question model with a stable id and text."""
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
     text: str = ""
     description: str = ""
+    # ordinals of the linked answers, in link order (a dict used as an ordered set)
+    answers: Dict[int, None] = field(default_factory=dict)
+    # keys of the JSON entry the model does not know, written back unchanged
+    extra: Optional[dict] = None
 
-@dataclass
+
+@dataclass(slots=True)
 class Answer:
     """Simple Answer model with a stable id and text."""
     id: str = field(default_factory=lambda: str(uuid.uuid4()))
     text: str = ""
+    # ordinals of the linked questions, in link order
+    questions: Dict[int, None] = field(default_factory=dict)
+    extra: Optional[dict] = None
+
+
+def _extra(entry: dict, known) -> Optional[dict]:
+    if len(entry) <= len(known):
+        return None
+    extra = {k: v for k, v in entry.items() if k not in known}
+    return extra or None
+
+
+def _ordinals(ordinals: Dict[str, int], ids) -> Dict[int, None]:
+    links = dict.fromkeys(map(ordinals.get, ids))
+    # dangling references are dropped
+    links.pop(None, None)
+    return links
+
+
+class QAGraph:
+    def __init__(self):
+        # ordinal -> model (None once removed; ordinals are never reused)
+        self.questions: List[Optional[Question]] = []
+        self.answers: List[Optional[Answer]] = []
+        self._question_ordinals: Dict[str, int] = {}
+        self._answer_ordinals: Dict[str, int] = {}
+
+    # --- interchange format ---
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QAGraph":
+        """Build the graph from dict-shaped data; a link listed on one side only is linked both ways."""
+        graph = cls()
+        questions = data.get("questions", {})
+        answers = data.get("answers", {})
+        q_ordinals = graph._question_ordinals = {qid: q for q, qid in enumerate(questions)}
+        a_ordinals = graph._answer_ordinals = {aid: a for a, aid in enumerate(answers)}
+        # each side in its own listed order first, then the missing reverse links
+        graph.questions = [
+            Question(qid, entry.get("text") or "", entry.get("description", ""),
+                     _ordinals(a_ordinals, entry.get("answers", ())), _extra(entry, ("text", "description", "answers")))
+            for qid, entry in questions.items()]
+        graph.answers = [
+            Answer(aid, entry.get("text") or "", _ordinals(q_ordinals, entry.get("questions", ())),
+                   _extra(entry, ("text", "questions")))
+            for aid, entry in answers.items()]
+        q_links = [question.answers for question in graph.questions]
+        a_links = [answer.questions for answer in graph.answers]
+        consistent = sum(map(len, q_links)) == sum(map(len, a_links))
+        for q, links in enumerate(q_links):
+            for a in links:
+                reverse = a_links[a]
+                if q not in reverse:
+                    reverse[q] = None
+                    consistent = False
+        if consistent:
+            # every question-side link is on the answer side too, and there are as many
+            return graph
+        for a, links in enumerate(a_links):
+            for q in links:
+                reverse = q_links[q]
+                if a not in reverse:
+                    reverse[a] = None
+        return graph
+
+    def to_dict(self) -> dict:
+        q_ids = [q.id if q is not None else None for q in self.questions]
+        a_ids = [a.id if a is not None else None for a in self.answers]
+        out_q = {}
+        for q in self.questions:
+            if q is not None:
+                entry = {"text": q.text, "description": q.description, "answers": list(map(a_ids.__getitem__, q.answers))}
+                if q.extra:
+                    entry.update(q.extra)
+                out_q[q.id] = entry
+        out_a = {}
+        for a in self.answers:
+            if a is not None:
+                entry = {"text": a.text, "questions": list(map(q_ids.__getitem__, a.questions))}
+                if a.extra:
+                    entry.update(a.extra)
+                out_a[a.id] = entry
+        return {"questions": out_q, "answers": out_a}
+
+    # --- reads ---
+
+    def question(self, qid: str) -> Optional[Question]:
+        q = self._question_ordinals.get(qid)
+        return None if q is None else self.questions[q]
+
+    def answer(self, aid: str) -> Optional[Answer]:
+        a = self._answer_ordinals.get(aid)
+        return None if a is None else self.answers[a]
+
+    def question_count(self) -> int:
+        return len(self._question_ordinals)
+
+    def answer_count(self) -> int:
+        return len(self._answer_ordinals)
+
+    def iter_questions(self) -> Iterator[Question]:
+        """Live questions in insertion order (a snapshot: safe while the graph changes)."""
+        return (q for q in list(self.questions) if q is not None)
+
+    def iter_answers(self) -> Iterator[Answer]:
+        return (a for a in list(self.answers) if a is not None)
+
+    def answers_of(self, question: Question) -> List[Answer]:
+        return [self.answers[a] for a in list(question.answers)]
+
+    def questions_of(self, answer: Answer) -> List[Question]:
+        return [self.questions[q] for q in list(answer.questions)]
+
+    # --- writes ---
+
+    def put_question(self, qid: str, text: str, description: str = "",
+                     extra: Optional[dict] = None) -> Optional[Question]:
+        """Add question qid, or replace it (dropping its links); returns the replaced model."""
+        q = self._question_ordinals.get(qid)
+        previous = None
+        if q is None:
+            self._question_ordinals[qid] = len(self.questions)
+            self.questions.append(Question(qid, text, description, {}, extra))
+        else:
+            previous = self.questions[q]
+            for a in previous.answers:
+                del self.answers[a].questions[q]
+            self.questions[q] = Question(qid, text, description, {}, extra)
+        return previous
+
+    def put_answer(self, aid: str, text: str, extra: Optional[dict] = None) -> Optional[Answer]:
+        """Add answer aid, or replace it (dropping its links); returns the replaced model."""
+        a = self._answer_ordinals.get(aid)
+        previous = None
+        if a is None:
+            self._answer_ordinals[aid] = len(self.answers)
+            self.answers.append(Answer(aid, text, {}, extra))
+        else:
+            previous = self.answers[a]
+            for q in previous.questions:
+                del self.questions[q].answers[a]
+            self.answers[a] = Answer(aid, text, {}, extra)
+        return previous
+
+    def restore_question(self, qid: str, previous: Optional[Question]):
+        """Undo put_question(qid, ...): remove the question, or put previous (and its links) back."""
+        q = self._question_ordinals[qid]
+        for a in self.questions[q].answers:
+            del self.answers[a].questions[q]
+        if previous is None:
+            del self._question_ordinals[qid]
+            self.questions[q] = None
+            return
+        self.questions[q] = previous
+        for a in previous.answers:
+            self.answers[a].questions[q] = None
+
+    def restore_answer(self, aid: str, previous: Optional[Answer]):
+        """Undo put_answer(aid, ...): remove the answer, or put previous (and its links) back."""
+        a = self._answer_ordinals[aid]
+        for q in self.answers[a].questions:
+            del self.questions[q].answers[a]
+        if previous is None:
+            del self._answer_ordinals[aid]
+            self.answers[a] = None
+            return
+        self.answers[a] = previous
+        for q in previous.questions:
+            self.questions[q].answers[a] = None
+
+    def link(self, answer_id: str, question_id: str) -> bool:
+        """Link both ways; False if already linked. KeyError for an unknown id."""
+        q = self._question_ordinals[question_id]
+        a = self._answer_ordinals[answer_id]
+        links = self.questions[q].answers
+        if a in links:
+            return False
+        links[a] = None
+        self.answers[a].questions[q] = None
+        return True
 
+    def unlink(self, answer_id: str, question_id: str) -> bool:
+        """Remove the link both ways; False if there was none (or an id is unknown)."""
+        q = self._question_ordinals.get(question_id)
+        a = self._answer_ordinals.get(answer_id)
+        if q is None or a is None or a not in self.questions[q].answers:
+            return False
+        del self.questions[q].answers[a]
+        del self.answers[a].questions[q]
+        return True
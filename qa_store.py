@@ -1,104 +1,477 @@
+import fcntl
 import json
 import os
+import threading
 import uuid
+from contextlib import contextmanager, nullcontext
 from tempfile import NamedTemporaryFile
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from qa_models import QAGraph
+from qa_wal import WriteAheadLog
+
+STORE_SAVE_SECONDS = metrics.Histogram("qa_store_save_seconds", "Duration of full JSON snapshot writes")
+STORE_SAVE_BYTES = metrics.Histogram("qa_store_save_bytes", "Size of written JSON snapshots",
+                                     buckets=metrics.SIZE_BUCKETS)
 
 # File-backed bidirectional QA store.
 # JSON layout:
 # {
-#   "questions": { "qid": {"text": "...", "answers": [aid, ...]}, ...},
+#   "questions": { "qid": {"text": "...", "description": "...", "answers": [aid, ...]}, ...},
 #   "answers":   { "aid": {"text": "...", "questions": [qid, ...]}, ...}
 # }
+# In memory the store is a QAGraph (qa_models.py): interned integer ids and
+# ordered-set adjacency, converted from / to this layout on load and save.
+#
+# Persistence: by default every committed mutation rewrites the JSON snapshot
+# atomically. With wal=True mutations are appended to <path>.wal instead (see
+# qa_wal.py) and replayed on load; compact_log() folds the log into the snapshot.
+# Stores opened without an explicit wal argument follow whatever the file uses,
+# and switch to the log when another process creates one.
+#
+# Several processes (gunicorn workers, admin scripts) may share one store: every
+# transaction runs under the lock of <path>.seq and bumps the counter it holds.
+# refresh() compares that counter (and the snapshot's mtime and size) with what
+# this process last loaded and picks up only what changed since.
+
+
+class SequenceFile:
+    """Change counter of a store, shared by all processes through <store>.seq."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def value(self) -> int:
+        try:
+            with open(self.path, "r", encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @contextmanager
+    def lock(self):
+        """Hold the exclusive lock: one transaction at a time, across processes and threads."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)) or ".", exist_ok=True)
+        with open(self.path, "a+", encoding="ascii") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def bump(self, locked_file) -> int:
+        """Increment the counter; locked_file is the handle yielded by lock()."""
+        locked_file.seek(0)
+        try:
+            value = int(locked_file.read().strip() or 0) + 1
+        except ValueError:
+            value = 1
+        locked_file.seek(0)
+        locked_file.truncate()
+        locked_file.write(str(value))
+        locked_file.flush()
+        return value
+
+
+def _record_event(record: dict) -> Tuple[str, dict]:
+    """Listener event (name, payload) of a mutation record: the op names are the event names."""
+    return record["op"], {k: record[k] for k in ("question_id", "answer_id") if k in record}
+
+
+class _Transaction(threading.local):
+    """Batch state of one thread: nesting depth, records to persist, undo closures."""
+
+    def __init__(self):
+        self.depth = 0
+        self.pending: List[dict] = []
+        self.undo: List[Callable[[], None]] = []
+
 
 class QuestionAnswerStore:
-    def __init__(self, path: str = "data/qa_store.json"):
+    def __init__(self, path: str = "data/qa_store.json", compact: bool = False,
+                 wal: Optional[bool] = None, fsync: str = "always"):
         self.path = path
-        self._data = {"questions": {}, "answers": {}}
+        # compact=True writes the JSON without indentation (smaller, faster to dump)
+        self.compact = compact
+        # wal=None: use the write-ahead log only if one exists for this store, now or
+        # later (see _follow_log); wal=False refuses a store that has one
+        if wal is False and os.path.exists(path + ".wal"):
+            raise ValueError(f"{path} has a write-ahead log; open it with wal=True or None")
+        self._wal_auto = wal is None
+        self._fsync = fsync
+        self._wal = None
+        if wal or (wal is None and os.path.exists(path + ".wal")):
+            self._wal = WriteAheadLog(path + ".wal", fsync=fsync)
+        self._wal_offset = 0
+        self._seq = SequenceFile(path + ".seq")
+        self._token = None
+        # value of the shared change counter that the in-memory data (and what the
+        # listeners derived from it) reflects; moves only after the listeners ran
+        self.seq = 0
+        # seq plus the snapshot (mtime, size) and log offset it counts from: the
+        # counter alone restarts at 0 without its .seq file and misses edits made
+        # while no process was running; moves together with seq (see _set_seq)
+        self.state_id = ""
+        self._graph = QAGraph()
+        self._listeners: List[Callable[[str, dict], None]] = []
+        # bumped on every mutation notification (cache invalidation key)
+        self.version = 0
+        # per thread: another thread's batch is never taken for a nested one
+        self._tx = _Transaction()
+        # held for a whole outermost batch (and by refresh / rewrite_snapshot): one
+        # transaction at a time within the process; the .seq flock covers the others
+        self._lock = threading.RLock()
         self._load()
+        self._set_seq(self._token[0])
+
+    def add_listener(self, callback: Callable[[str, dict], None]):
+        """Register callback(event, payload), called after every mutation.
+
+        Events: "add_question" {question_id}, "add_answer" {answer_id},
+        "link" / "remove_link" {answer_id, question_id}, and "reset" {} when
+        the whole content changed (e.g. a batch was rolled back). refresh()
+        sends the same events for changes made by other processes ("add_question"
+        / "add_answer" also mean "edited"). store.version is incremented before
+        the callbacks run.
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, **payload):
+        self.version += 1
+        for callback in self._listeners:
+            callback(event, payload)
+
+    def _change_token(self):
+        try:
+            st = os.stat(self.path)
+            snapshot = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            snapshot = None
+        return self._seq.value(), snapshot
 
     def _load(self):
+        # read first: anything written from now on is picked up by the next refresh()
+        self._token = self._change_token()
+        graph = QAGraph()
         if os.path.exists(self.path):
             try:
                 with open(self.path, "r", encoding="utf-8") as f:
-                    self._data = json.load(f)
+                    graph = QAGraph.from_dict(json.load(f))
             except Exception:
                 # If file is corrupted, start fresh but don't overwrite until save is called
-                self._data = {"questions": {}, "answers": {}}
+                graph = QAGraph()
+        self._wal_offset = 0
+        if self._wal is not None:
+            for records, end in self._wal.read_from(0):
+                for record in records:
+                    self._apply(record, graph)
+                self._wal_offset = end
+        # swapped in whole: readers never see a half-loaded store
+        self._graph = graph
+        self._tx.undo = []
+
+    def refresh(self) -> bool:
+        """Pick up the changes other processes persisted since this one last loaded or wrote.
+
+        Listeners get the usual events for whatever changed ("reset" if something
+        was removed). Returns False, after one small read and a stat, when
+        nothing changed.
+        """
+        if self._tx.depth or self._change_token() == self._token:
+            return False
+        with self._lock, self._seq.lock() as seq_file:
+            return self._refresh_locked(seq_file)
+
+    def _follow_log(self):
+        """Switch to the write-ahead log once another process created one: writes
+        logged there are not in the snapshot, and would otherwise never be seen."""
+        if self._wal is not None or not os.path.exists(self.path + ".wal"):
+            return
+        if not self._wal_auto:
+            raise RuntimeError(f"{self.path} has a write-ahead log but was opened with wal=False")
+        self._wal = WriteAheadLog(self.path + ".wal", fsync=self._fsync)
+        self._wal_offset = 0
+
+    def _refresh_locked(self, seq_file) -> bool:
+        self._follow_log()
+        token = self._change_token()
+        if token == self._token:
+            return False
+        if self._wal is not None and token[1] == self._token[1] and self._wal.size() >= self._wal_offset:
+            # same snapshot, longer log: replay only the transactions appended since
+            records = []
+            for transaction, end in self._wal.read_from(self._wal_offset):
+                for record in transaction:
+                    self._apply(record)
+                records.extend(transaction)
+                self._wal_offset = end
+            self._tx.undo = []
+            self._token = token
+            for record in records:
+                event, payload = _record_event(record)
+                self._notify(event, **payload)
+        else:
+            previous = self._graph
+            self._load()
+            if self._token[0] == self.seq:
+                # the file was edited without a transaction: count it, for the other processes
+                self._token = (self._seq.bump(seq_file), self._token[1])
+            self._notify_changes(previous)
+        self._set_seq(self._token[0])
+        return True
+
+    def _set_seq(self, seq: int):
+        mtime_ns, size = self._token[1] or (0, 0)
+        self.state_id = f"{mtime_ns:x}-{size:x}-{self._wal_offset:x}.{seq}"
+        self.seq = seq
+
+    def _notify_changes(self, previous: QAGraph):
+        """Notify listeners of the differences between previous and the reloaded graph."""
+        graph = self._graph
+        if any(graph.question(q.id) is None for q in previous.iter_questions()) or any(
+                graph.answer(a.id) is None for a in previous.iter_answers()):
+            self._notify("reset")
+            return
+        for answer in graph.iter_answers():
+            before = previous.answer(answer.id)
+            if before is None or before.text != answer.text:
+                self._notify("add_answer", answer_id=answer.id)
+        for question in graph.iter_questions():
+            before = previous.question(question.id)
+            if before is None or before.text != question.text or before.description != question.description:
+                self._notify("add_question", question_id=question.id)
+            # ordinals differ between the two graphs: compare ids
+            old_links = {a.id for a in previous.answers_of(before)} if before is not None else set()
+            new_links = {a.id for a in graph.answers_of(question)}
+            for aid in new_links - old_links:
+                self._notify("link", answer_id=aid, question_id=question.id)
+            for aid in old_links - new_links:
+                self._notify("remove_link", answer_id=aid, question_id=question.id)
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one transaction.
+
+        Inside the block nothing is written; the store is persisted once, atomically,
+        when the outermost batch exits. If the block raises, the in-memory data is
+        rolled back to its state before the batch and nothing is written.
+
+        The outermost batch holds the store's cross-process lock and starts by
+        loading what other processes wrote, so ids are allocated on current data
+        and concurrent writers never overwrite each other.
+
+            with store.batch():
+                aid = store.add_answer("...")
+                for qid in qids:
+                    store.link(aid, qid)
+        """
+        tx = self._tx
+        if tx.depth:
+            # nested batch: part of the enclosing transaction
+            tx.depth += 1
+            try:
+                yield self
+            finally:
+                tx.depth -= 1
+            return
+
+        with self._lock, self._seq.lock() as seq_file:
+            self._refresh_locked(seq_file)
+            tx.depth = 1
+            try:
+                yield self
+            except BaseException:
+                rolled_back = bool(tx.undo)
+                for undo in reversed(tx.undo):
+                    undo()
+                tx.pending, tx.undo = [], []
+                tx.depth = 0
+                if rolled_back:
+                    self._notify("reset")
+                raise
+            records, tx.pending, tx.undo = tx.pending, [], []
+            tx.depth = 0
+            if records:
+                self._persist(records)
+                seq = self._seq.bump(seq_file)
+                if self._wal is not None:
+                    self._wal_offset = self._wal.size()
+                self._token = (seq, self._change_token()[1])
+                self._set_seq(seq)
+
+    def _commit(self, record: dict):
+        """Queue an applied mutation; the enclosing batch persists it when it exits."""
+        self._tx.pending.append(record)
+
+    def _persist(self, records: List[dict]):
+        if not records:
+            return
+        if self._wal is not None:
+            self._wal.append(records)
+        else:
+            self._save()
 
     def _save(self):
         # atomic write
         dirpath = os.path.dirname(os.path.abspath(self.path)) or "."
         os.makedirs(dirpath, exist_ok=True)
-        with NamedTemporaryFile("w", dir=dirpath, delete=False, encoding="utf-8") as tf:
-            json.dump(self._data, tf, ensure_ascii=False, indent=2)
-            tmpname = tf.name
-        os.replace(tmpname, self.path)
+        with STORE_SAVE_SECONDS.time():
+            with NamedTemporaryFile("w", dir=dirpath, delete=False, encoding="utf-8") as tf:
+                data = self._graph.to_dict()
+                if self.compact:
+                    json.dump(data, tf, ensure_ascii=False, separators=(",", ":"))
+                else:
+                    json.dump(data, tf, ensure_ascii=False, indent=2)
+                size = tf.tell()
+                tmpname = tf.name
+            os.replace(tmpname, self.path)
+        STORE_SAVE_BYTES.observe(size)
+
+    def compact_log(self):
+        """Fold the write-ahead log into the JSON snapshot and truncate it."""
+        if self._wal is None or not os.path.exists(self._wal.path):
+            # nothing to fold (and creating an empty log would switch the store to it)
+            return
+        self.rewrite_snapshot()
+
+    def rewrite_snapshot(self):
+        """Reload the store and write it back as one atomic snapshot (folding in the log, if any).
+
+        The file comes out normalized: every link listed on both sides, no
+        references to missing ids (see QAGraph.from_dict).
+        """
+        with self._lock, self._seq.lock() as seq_file:
+            self._follow_log()
+            logged = self._wal is not None and os.path.exists(self._wal.path)
+            with self._wal.lock() if logged else nullcontext() as log:
+                # pick up transactions appended by other processes first
+                self._load()
+                self._save()
+                if logged:
+                    self._wal.truncate(log)
+                self._wal_offset = 0
+            self._token = (self._seq.bump(seq_file), self._change_token()[1])
+        self._notify("reset")
+        self._set_seq(self._token[0])
+
+    # --- mutations: _apply() changes the graph and records how to undo it ---
+
+    def _apply(self, record: dict, graph: Optional[QAGraph] = None):
+        """Apply record to graph (default: the store's graph); graph is used while (re)loading."""
+        if graph is None:
+            graph = self._graph
+        op = record["op"]
+        if op == "add_question":
+            qid = record["question_id"]
+            previous = graph.put_question(qid, record["text"], record["text"])
+            self._tx.undo.append(lambda: graph.restore_question(qid, previous))
+        elif op == "add_answer":
+            aid = record["answer_id"]
+            previous = graph.put_answer(aid, record["text"])
+            self._tx.undo.append(lambda: graph.restore_answer(aid, previous))
+        elif op == "link":
+            aid, qid = record["answer_id"], record["question_id"]
+            if graph.question(qid) is None or graph.answer(aid) is None:
+                # a logged link to an unknown id is dropped, like a dangling id in
+                # the snapshot (QAGraph.from_dict); link() checks ids before logging
+                return
+            if graph.link(aid, qid):
+                self._tx.undo.append(lambda: graph.unlink(aid, qid))
+        elif op == "remove_link":
+            aid, qid = record["answer_id"], record["question_id"]
+            # a link restored by a rollback goes back at the end of both link lists
+            if graph.unlink(aid, qid):
+                self._tx.undo.append(lambda: graph.link(aid, qid))
+        else:
+            raise ValueError(f"Unknown store operation: {op}")
 
     def add_question(self, text: str) -> str:
-        # ID is the next question ID available
-        qid = str(self._data["questions"].__len__() + 1)
-        self._data["questions"][qid] = {"text": text, "description": text, "answers": []}
-        self._save()
+        with self.batch():
+            # ID is the next question ID available
+            qid = str(self._graph.question_count() + 1)
+            record = {"op": "add_question", "question_id": qid, "text": text}
+            self._apply(record)
+            self._commit(record)
+        self._notify("add_question", question_id=qid)
         return qid
 
     def add_answer(self, text: str, question_ids: Optional[List[str]] = None) -> str:
         # ID is the next question ID available
-        aid = str(self._data["answers"].__len__() + 1)
-        self._data["answers"][aid] = {"text": text, "questions": []}
-        # Link after registering answer
-        if question_ids:
-            for qid in question_ids:
+        with self.batch():
+            aid = str(self._graph.answer_count() + 1)
+            record = {"op": "add_answer", "answer_id": aid, "text": text}
+            self._apply(record)
+            self._commit(record)
+            # Link after registering answer
+            for qid in question_ids or []:
                 self.link(aid, qid)
-        else:
-            self._save()
+        self._notify("add_answer", answer_id=aid)
         return aid
 
     def link(self, answer_id: str, question_id: str):
-        if question_id not in self._data["questions"]:
-            raise KeyError(f"Unknown question id: {question_id}")
-        if answer_id not in self._data["answers"]:
-            raise KeyError(f"Unknown answer id: {answer_id}")
-
-        q_list = self._data["questions"][question_id].setdefault("answers", [])
-        a_list = self._data["answers"][answer_id].setdefault("questions", [])
+        with self.batch():
+            if self._graph.question(question_id) is None:
+                raise KeyError(f"Unknown question id: {question_id}")
+            if self._graph.answer(answer_id) is None:
+                raise KeyError(f"Unknown answer id: {answer_id}")
 
-        if answer_id not in q_list:
-            q_list.append(answer_id)
-        if question_id not in a_list:
-            a_list.append(question_id)
-        self._save()
+            record = {"op": "link", "answer_id": answer_id, "question_id": question_id}
+            self._apply(record)
+            self._commit(record)
+            self._notify("link", answer_id=answer_id, question_id=question_id)
 
     def add_answer_to_questions(self, answer_id: str, question_ids: List[str]):
-        for qid in question_ids:
-            self.link(answer_id, qid)
+        with self.batch():
+            for qid in question_ids:
+                self.link(answer_id, qid)
+
+    def get_question(self, question_id: str) -> Optional[dict]:
+        """Return the question object ({"text", "description", "answers"}) or None."""
+        question = self._graph.question(question_id)
+        if question is None:
+            return None
+        return {"text": question.text, "description": question.description,
+                "answers": [a.id for a in self._graph.answers_of(question)]}
+
+    def iter_questions(self) -> Iterator[Tuple[str, dict]]:
+        """Yield (question_id, {"text", "description"}) in insertion order."""
+        for question in self._graph.iter_questions():
+            yield question.id, {"text": question.text, "description": question.description}
 
     def get_answers_for_question(self, question_id: str) -> List[Dict[str, str]]:
-        if question_id not in self._data["questions"]:
+        question = self._graph.question(question_id)
+        if question is None:
             return []
-        return [
-            {"id": aid, "text": self._data["answers"][aid]["text"]}
-            for aid in self._data["questions"][question_id].get("answers", [])
-            if aid in self._data["answers"]
-        ]
+        return [{"id": a.id, "text": a.text} for a in self._graph.answers_of(question)]
 
     def get_questions_for_answer(self, answer_id: str) -> List[Dict[str, str]]:
-        if answer_id not in self._data["answers"]:
+        answer = self._graph.answer(answer_id)
+        if answer is None:
             return []
-        return [
-            {"id": qid, "text": self._data["questions"][qid]["text"], "description": self._data["questions"][qid].get("description", "")}
-            for qid in self._data["answers"][answer_id].get("questions", [])
-            if qid in self._data["questions"]
-        ]
+        return [{"id": q.id, "text": q.text, "description": q.description} for q in self._graph.questions_of(answer)]
+
+    def question_count(self) -> int:
+        return self._graph.question_count()
+
+    def answer_count(self) -> int:
+        return self._graph.answer_count()
 
     def remove_link(self, answer_id: str, question_id: str):
-        if question_id in self._data["questions"]:
-            q_answers = self._data["questions"][question_id].get("answers", [])
-            if answer_id in q_answers:
-                q_answers.remove(answer_id)
-        if answer_id in self._data["answers"]:
-            a_questions = self._data["answers"][answer_id].get("questions", [])
-            if question_id in a_questions:
-                a_questions.remove(question_id)
-        self._save()
+        with self.batch():
+            record = {"op": "remove_link", "answer_id": answer_id, "question_id": question_id}
+            self._apply(record)
+            self._commit(record)
+            self._notify("remove_link", answer_id=answer_id, question_id=question_id)
+
 
+def open_store(path: str, backend: Optional[str] = None, **kwargs):
+    """Open a QA store: backend "json" or "sqlite" (default: guessed from the file extension)."""
+    if backend is None:
+        backend = "sqlite" if os.path.splitext(path)[1] in (".sqlite3", ".sqlite", ".db") else "json"
+    if backend == "sqlite":
+        from qa_store_sqlite import SQLiteQuestionAnswerStore
+        return SQLiteQuestionAnswerStore(path)
+    if backend == "json":
+        return QuestionAnswerStore(path, **kwargs)
+    raise ValueError(f"Unknown QA store backend: {backend}")
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""SQLite-backed QA store with the same public API as QuestionAnswerStore.
+
+Nothing is loaded in memory: every read is an indexed query against a shared
+on-disk database opened in WAL mode, so all gunicorn workers read concurrently
+while writers serialize on SQLite's own lock.
+
+Schema:
+    questions(id, text, description)            -- rowid keeps insertion order
+    answers(id, text)
+    links(question_id, answer_id)               -- unique pair, indexed both ways
+    changes(seq, event, question_id, answer_id) -- filled by triggers, read by refresh()
+
+Every write, from any process, is recorded in `changes` by triggers, so
+refresh() can tell the listeners of this process exactly what other processes
+changed. Only the last CHANGES_KEEP entries are kept.
+
+Usage:
+    python qa_store_sqlite.py migrate [json_path] [sqlite_path]
+        # one-shot import of data/qa_store.json into data/qa_store.sqlite3
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS answers (
+    id TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS links (
+    question_id TEXT NOT NULL REFERENCES questions(id),
+    answer_id TEXT NOT NULL REFERENCES answers(id),
+    UNIQUE (question_id, answer_id)
+);
+CREATE INDEX IF NOT EXISTS links_by_answer ON links(answer_id, question_id);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event TEXT NOT NULL,
+    question_id TEXT,
+    answer_id TEXT
+);
+CREATE TRIGGER IF NOT EXISTS questions_added AFTER INSERT ON questions
+BEGIN INSERT INTO changes (event, question_id) VALUES ('add_question', NEW.id); END;
+CREATE TRIGGER IF NOT EXISTS questions_edited AFTER UPDATE ON questions
+BEGIN INSERT INTO changes (event, question_id) VALUES ('add_question', NEW.id); END;
+CREATE TRIGGER IF NOT EXISTS questions_removed AFTER DELETE ON questions
+BEGIN INSERT INTO changes (event) VALUES ('reset'); END;
+CREATE TRIGGER IF NOT EXISTS answers_added AFTER INSERT ON answers
+BEGIN INSERT INTO changes (event, answer_id) VALUES ('add_answer', NEW.id); END;
+CREATE TRIGGER IF NOT EXISTS answers_edited AFTER UPDATE ON answers
+BEGIN INSERT INTO changes (event, answer_id) VALUES ('add_answer', NEW.id); END;
+CREATE TRIGGER IF NOT EXISTS answers_removed AFTER DELETE ON answers
+BEGIN INSERT INTO changes (event) VALUES ('reset'); END;
+CREATE TRIGGER IF NOT EXISTS links_added AFTER INSERT ON links
+BEGIN INSERT INTO changes (event, question_id, answer_id) VALUES ('link', NEW.question_id, NEW.answer_id); END;
+CREATE TRIGGER IF NOT EXISTS links_removed AFTER DELETE ON links
+BEGIN INSERT INTO changes (event, question_id, answer_id) VALUES ('remove_link', OLD.question_id, OLD.answer_id); END;
+"""
+
+# Entries of the changes table kept for processes that have not refreshed yet;
+# a process further behind gets a single "reset"
+CHANGES_KEEP = 10000
+
+
+class SQLiteQuestionAnswerStore:
+    def __init__(self, path: str = "data/qa_store.sqlite3"):
+        self.path = path
+        self._local = threading.local()
+        self._listeners: List[Callable[[str, dict], None]] = []
+        # bumped on every mutation notification (cache invalidation key)
+        self.version = 0
+        dirpath = os.path.dirname(os.path.abspath(path)) or "."
+        os.makedirs(dirpath, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        # refresh() and the end of a write move seq forward under this lock
+        self._seq_lock = threading.Lock()
+        # the database file's inode tells a re-created database (whose seq restarts) apart
+        self._inode = os.stat(path).st_ino
+        self._set_seq(self._last_change())
+
+    def _conn(self) -> sqlite3.Connection:
+        # one connection per thread and per process (connections must not cross fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.batch_depth = 0
+        return conn
+
+    def add_listener(self, callback: Callable[[str, dict], None]):
+        """Register callback(event, payload); same events as QuestionAnswerStore."""
+        self._listeners.append(callback)
+
+    def _notify(self, event: str, **payload):
+        self.version += 1
+        for callback in self._listeners:
+            callback(event, payload)
+
+    def _set_seq(self, seq: int):
+        # seq and the identity of the data it counts in (see QuestionAnswerStore.state_id)
+        self.state_id = f"{self._inode:x}.{seq}"
+        self.seq = seq
+
+    def _last_change(self) -> int:
+        (seq,) = self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()
+        return seq
+
+    def refresh(self) -> bool:
+        """Send listeners the events of the writes other processes made since the last call.
+
+        Returns False, after one indexed lookup, when nothing changed.
+        """
+        with self._seq_lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self) -> bool:
+        conn = self._conn()
+        rows = conn.execute("SELECT seq, event, question_id, answer_id FROM changes WHERE seq > ? ORDER BY seq",
+                            (self.seq,)).fetchall()
+        if not rows:
+            return False
+        if rows[0][0] > self.seq + 1 or any(row[1] == "reset" for row in rows):
+            # entries this process never saw were pruned (or something was removed): rebuild
+            self._notify("reset")
+        else:
+            for _seq, event, qid, aid in rows:
+                payload = {}
+                if qid is not None:
+                    payload["question_id"] = qid
+                if aid is not None:
+                    payload["answer_id"] = aid
+                self._notify(event, **payload)
+        # moved once the listeners are up to date
+        self._set_seq(rows[-1][0])
+        return True
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one SQLite transaction, rolled back if the block raises."""
+        conn = self._conn()
+        local = self._local
+        if local.batch_depth:
+            local.batch_depth += 1
+            try:
+                yield self
+            finally:
+                local.batch_depth -= 1
+            return
+        # IMMEDIATE: take the write lock up front so id allocation can't race other workers
+        conn.execute("BEGIN IMMEDIATE")
+        local.batch_depth = 1
+        try:
+            with self._seq_lock:
+                # listeners see other processes' writes before this transaction's own events
+                self._refresh_locked()
+                try:
+                    yield self
+                except BaseException:
+                    local.batch_depth = 0
+                    conn.execute("ROLLBACK")
+                    self._notify("reset")
+                    raise
+                local.batch_depth = 0
+                # this transaction's own changes were notified as they were made
+                self._set_seq(self._last_change())
+                conn.execute("DELETE FROM changes WHERE seq <= ?", (self.seq - CHANGES_KEEP,))
+                conn.execute("COMMIT")
+        finally:
+            # a listener raised during the refresh, or the commit failed: never leave
+            # this thread inside the transaction (and other workers locked out)
+            local.batch_depth = 0
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+
+    # --- reads ---
+
+    def get_question(self, question_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT text, description FROM questions WHERE id = ?", (question_id,)).fetchone()
+        if row is None:
+            return None
+        answers = [r[0] for r in self._conn().execute(
+            "SELECT answer_id FROM links WHERE question_id = ? ORDER BY rowid", (question_id,))]
+        return {"text": row[0], "description": row[1], "answers": answers}
+
+    def iter_questions(self) -> Iterator[Tuple[str, dict]]:
+        """Yield (question_id, {"text", "description"}) in insertion order."""
+        for qid, text, desc in self._conn().execute("SELECT id, text, description FROM questions ORDER BY rowid"):
+            yield qid, {"text": text, "description": desc}
+
+    def get_answers_for_question(self, question_id: str) -> List[Dict[str, str]]:
+        return [
+            {"id": aid, "text": text}
+            for aid, text in self._conn().execute(
+                "SELECT a.id, a.text FROM links l JOIN answers a ON a.id = l.answer_id"
+                " WHERE l.question_id = ? ORDER BY l.rowid", (question_id,))
+        ]
+
+    def get_questions_for_answer(self, answer_id: str) -> List[Dict[str, str]]:
+        return [
+            {"id": qid, "text": text, "description": desc}
+            for qid, text, desc in self._conn().execute(
+                "SELECT q.id, q.text, q.description FROM links l JOIN questions q ON q.id = l.question_id"
+                " WHERE l.answer_id = ? ORDER BY l.rowid", (answer_id,))
+        ]
+
+    def question_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+
+    def answer_count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    # --- writes ---
+
+    def add_question(self, text: str) -> str:
+        with self.batch():
+            # ID is the next question ID available
+            qid = str(self.question_count() + 1)
+            self._conn().execute("INSERT INTO questions (id, text, description) VALUES (?, ?, ?)", (qid, text, text))
+        self._notify("add_question", question_id=qid)
+        return qid
+
+    def add_answer(self, text: str, question_ids: Optional[List[str]] = None) -> str:
+        with self.batch():
+            aid = str(self.answer_count() + 1)
+            self._conn().execute("INSERT INTO answers (id, text) VALUES (?, ?)", (aid, text))
+            # Link after registering answer
+            for qid in question_ids or []:
+                self.link(aid, qid)
+        self._notify("add_answer", answer_id=aid)
+        return aid
+
+    def link(self, answer_id: str, question_id: str):
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM questions WHERE id = ?", (question_id,)).fetchone() is None:
+            raise KeyError(f"Unknown question id: {question_id}")
+        if conn.execute("SELECT 1 FROM answers WHERE id = ?", (answer_id,)).fetchone() is None:
+            raise KeyError(f"Unknown answer id: {answer_id}")
+        with self.batch():
+            conn.execute("INSERT OR IGNORE INTO links (question_id, answer_id) VALUES (?, ?)",
+                         (question_id, answer_id))
+            self._notify("link", answer_id=answer_id, question_id=question_id)
+
+    def add_answer_to_questions(self, answer_id: str, question_ids: List[str]):
+        with self.batch():
+            for qid in question_ids:
+                self.link(answer_id, qid)
+
+    def remove_link(self, answer_id: str, question_id: str):
+        with self.batch():
+            self._conn().execute("DELETE FROM links WHERE question_id = ? AND answer_id = ?",
+                                 (question_id, answer_id))
+            self._notify("remove_link", answer_id=answer_id, question_id=question_id)
+
+
+def migrate(json_path: str, sqlite_path: str) -> SQLiteQuestionAnswerStore:
+    """Import a qa_store.json file into a (new or existing) SQLite store."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    store = SQLiteQuestionAnswerStore(sqlite_path)
+    questions = data.get("questions", {})
+    answers = data.get("answers", {})
+    with store.batch():
+        conn = store._conn()
+        conn.executemany(
+            "INSERT INTO questions (id, text, description) VALUES (?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET text = excluded.text, description = excluded.description",
+            ((qid, q.get("text") or "", q.get("description") or "") for qid, q in questions.items()))
+        conn.executemany(
+            "INSERT INTO answers (id, text) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET text = excluded.text",
+            ((aid, a.get("text") or "") for aid, a in answers.items()))
+        # links in question order; dangling references are dropped
+        conn.executemany(
+            "INSERT OR IGNORE INTO links (question_id, answer_id) VALUES (?, ?)",
+            ((qid, aid) for qid, q in questions.items() for aid in q.get("answers", []) if aid in answers))
+        conn.executemany(
+            "INSERT OR IGNORE INTO links (question_id, answer_id) VALUES (?, ?)",
+            ((qid, aid) for aid, a in answers.items() for qid in a.get("questions", []) if qid in questions))
+    return store
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != "migrate":
+        print(__doc__)
+        return 2
+    base = os.path.dirname(__file__)
+    json_path = argv[2] if len(argv) > 2 else os.path.join(base, "data/qa_store.json")
+    sqlite_path = argv[3] if len(argv) > 3 else os.path.splitext(json_path)[0] + ".sqlite3"
+    store = migrate(json_path, sqlite_path)
+    nq, na = store.question_count(), store.answer_count()
+    (nl,) = store._conn().execute("SELECT COUNT(*) FROM links").fetchone()
+    print(f"Migrated {nq} questions, {na} answers and {nl} links into {sqlite_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
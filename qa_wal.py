@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Append-only write-ahead log for QuestionAnswerStore.
+
+Instead of rewriting the whole JSON snapshot on every mutation, a store opened
+with wal=True appends the mutation records to <store>.wal. Each line of the log
+is one transaction: a JSON list of records such as
+
+    [{"op": "add_answer", "answer_id": "23", "text": "..."},
+     {"op": "link", "answer_id": "23", "question_id": "4"}]
+
+On load the store replays the log on top of the last snapshot. A torn last line
+(crash during a write) is ignored, and the next append cuts it off before
+writing, so a transaction is applied entirely or not at all. Compaction folds the log back into the snapshot and truncates it.
+
+fsync policies:
+  - "always"   : fsync after every transaction (durable, slowest)
+  - "interval" : fsync at most every fsync_interval seconds
+  - "never"    : leave flushing to the OS
+
+Usage:
+    python qa_wal.py compact [store_path]    # fold data/qa_store.json.wal into the snapshot
+"""
+
+import fcntl
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def _cut_torn_tail(f):
+    """Truncate f after its last newline: drops a line left half-written by a crash.
+
+    Appending right after the partial bytes would merge them with the next
+    transaction into one invalid line, and readers stop at the first invalid line.
+    """
+    end = f.seek(0, os.SEEK_END)
+    if end == 0:
+        return
+    f.seek(end - 1)
+    if f.read(1) == b"\n":
+        return
+    pos = end - 1
+    while pos > 0:
+        start = max(0, pos - 65536)
+        f.seek(start)
+        newline = f.read(pos - start).rfind(b"\n")
+        if newline >= 0:
+            f.truncate(start + newline + 1)
+            return
+        pos = start
+    f.truncate(0)
+
+
+class WriteAheadLog:
+    def __init__(self, path: str, fsync: str = "always", fsync_interval: float = 1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync} (expected one of {FSYNC_POLICIES})")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._last_sync = 0.0
+
+    def append(self, records: List[dict]):
+        """Append one transaction (a list of records) as a single line."""
+        if not records:
+            return
+        line = json.dumps(records, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with open(self.path, "a+b") as f:
+            # serialize writers from several processes
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                _cut_torn_tail(f)
+                f.write(line.encode("utf-8"))
+                f.flush()
+                if self.fsync == "always" or (
+                        self.fsync == "interval" and time.monotonic() - self._last_sync >= self.fsync_interval):
+                    os.fsync(f.fileno())
+                    self._last_sync = time.monotonic()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self) -> Iterator[List[dict]]:
+        """Yield the logged transactions in order, skipping a torn trailing line."""
+        for records, _end in self.read_from(0):
+            yield records
+
+    def read_from(self, offset: int) -> Iterator[Tuple[List[dict], int]]:
+        """Yield (transaction, byte offset just after it) for the transactions logged from offset on."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records = json.loads(line)
+                except ValueError:
+                    break
+                offset += len(line)
+                yield records, offset
+
+    def size(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    @contextmanager
+    def lock(self):
+        """Hold the log's exclusive lock: no other writer can append meanwhile."""
+        with open(self.path, "a", encoding="utf-8") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def truncate(self, locked_file):
+        """Empty the log; locked_file is the handle yielded by lock()."""
+        locked_file.truncate(0)
+        os.fsync(locked_file.fileno())
+
+
+def main(argv):
+    from qa_store import QuestionAnswerStore
+
+    if len(argv) < 2 or argv[1] != "compact":
+        print(__doc__)
+        return 2
+    store_path = argv[2] if len(argv) > 2 else os.path.join(os.path.dirname(__file__), "data/qa_store.json")
+    store = QuestionAnswerStore(store_path, wal=True)
+    size = store._wal.size()
+    store.compact_log()
+    print(f"Compacted {size} bytes of log into {store_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv))
@@ -0,0 +1,116 @@
+"""Micro-batching of concurrent query encodes.
+
+Requests handled concurrently by one process (gunicorn threads) each need a
+single query embedding. Instead of one transformer forward pass per query, the
+QueryBatcher gathers the queries that arrive within a few milliseconds (up to a
+maximum batch size), encodes them with a single call and hands every caller its
+own vector.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, List, Optional
+
+import numpy as np
+
+
+class QueryBatcher:
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 8,
+                 max_wait_ms: float = 2.0):
+        """encode(list_of_queries) must return one row per query."""
+        self._encode = encode
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._batch_sizes = Counter()
+        self._queries = 0
+        self._encoded = 0
+
+    def encode(self, query: str, timeout: Optional[float] = None) -> np.ndarray:
+        """Encode one query, possibly together with queries from other threads."""
+        if self.max_batch_size == 1:
+            vec = np.asarray(self._encode([query]))[0]
+            self._record(1)
+            return vec
+        self._ensure_worker()
+        fut = Future()
+        self._queue.put((query, fut))
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeoutError:
+            fut.cancel()
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queries": self._queries,
+                "encoded": self._encoded,
+                "batches": batches,
+                "mean_batch_size": (self._queries / batches) if batches else 0.0,
+                "batch_sizes": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+            }
+
+    def _record(self, size: int, encoded: Optional[int] = None):
+        """size: queries answered by the batch; encoded: distinct texts sent to the model."""
+        with self._lock:
+            self._batch_sizes[size] += 1
+            self._queries += size
+            self._encoded += size if encoded is None else encoded
+
+    def _ensure_worker(self):
+        # Threads don't survive fork(): (re)start the worker in each process
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+            self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # callers whose deadline already passed don't need a vector
+            batch = [(q, fut) for q, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            # identical queries in the same batch are encoded once
+            unique = list(dict.fromkeys(q for q, _fut in batch))
+            try:
+                vectors = np.asarray(self._encode(unique))
+            except Exception as e:
+                for _q, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self._record(len(batch), len(unique))
+            rows = {q: i for i, q in enumerate(unique)}
+            for q, fut in batch:
+                fut.set_result(vectors[rows[q]])
@@ -0,0 +1,90 @@
+"""Result cache of /api/search, keyed on the normalized query.
+
+normalize_query() casefolds, strips accents and collapses whitespace, so
+"Analyse Fumée " and "analyse fumee" share one entry. Entries are bounded by
+their total size in bytes (least recently used evicted first), expire after a
+TTL, and are tagged with the store version they were computed at: a lookup at
+a newer version drops the whole cache, as any mutation may change any result.
+"""
+
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+# Rough per-entry bookkeeping cost (key object, tuple, OrderedDict node)
+ENTRY_OVERHEAD = 200
+
+
+def normalize_query(text: str) -> str:
+    """Casefold, strip accents and collapse whitespace: "  Analyse  Fumée" -> "analyse fumee"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.split())
+
+
+class QueryResultCache:
+    def __init__(self, max_bytes: int = 16 << 20, ttl: float = 300.0):
+        """max_bytes: budget for cached values (bytes objects) and keys; 0 disables the cache."""
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Any, bytes, int]]" = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def _advance(self, version: int) -> bool:
+        """Drop everything when version is newer; False if version is older than the cache."""
+        if self._version is None or version > self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        return version == self._version
+
+    def get(self, key: str, version: int) -> Optional[Tuple[Any, bytes]]:
+        """Return (meta, value) cached for key at this store version, else None."""
+        if not self.max_bytes:
+            return None
+        with self._lock:
+            entry = self._entries.get(key) if self._advance(version) else None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires, meta, value, size = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return meta, value
+
+    def put(self, key: str, version: int, meta: Any, value: bytes):
+        size = len(value) + len(key) + ENTRY_OVERHEAD
+        if not self.max_bytes or size > self.max_bytes:
+            return
+        with self._lock:
+            if not self._advance(version):
+                # computed before a mutation that newer entries already reflect
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[3]
+            self._entries[key] = (time.monotonic() + self.ttl, meta, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[3]
+                self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes,
+                        hit_rate=(self._stats["hits"] / lookups) if lookups else 0.0)
@@ -0,0 +1,103 @@
+"""Character n-gram inverted index for the substring tier of /api/search.
+
+SubstringIndex answers "which texts contain this query" with exactly the
+semantics of the original linear scan, after folding both sides:
+
+    fold(query) in fold(text.strip())
+
+fold defaults to str.lower (case-insensitive); the app passes
+query_cache.normalize_query so that accents and extra spaces are ignored too.
+
+Every n-gram of the query must appear in a matching text, so the posting lists
+of the query n-grams are intersected (smallest first) and only the surviving
+candidates are verified with the real substring test. Queries shorter than n
+characters fall back to verifying every text.
+"""
+
+import threading
+from typing import Callable, Dict, Iterable, List, Set, Tuple
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SubstringIndex:
+    def __init__(self, n: int = 3, fold: Callable[[str], str] = str.lower):
+        self.n = n
+        self.fold = fold
+        self._lock = threading.RLock()
+        self._keys: List[str] = []           # ordinal -> key, in insertion order
+        self._texts: Dict[int, str] = {}     # ordinal -> folded text (live entries only)
+        self._ordinals: Dict[str, int] = {}  # key -> ordinal
+        self._postings: Dict[str, Set[int]] = {}
+
+    @classmethod
+    def from_items(cls, items: Iterable[Tuple[str, str]], n: int = 3,
+                   fold: Callable[[str], str] = str.lower) -> "SubstringIndex":
+        index = cls(n, fold)
+        for key, text in items:
+            index.add(key, text)
+        return index
+
+    @classmethod
+    def from_questions(cls, questions: Iterable[Tuple[str, dict]], n: int = 3,
+                       fold: Callable[[str], str] = str.lower) -> "SubstringIndex":
+        """Index question `text` fields from (question_id, question) pairs."""
+        return cls.from_items(((qid, qobj.get("text") or "") for qid, qobj in questions), n, fold)
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, key: str, text: str):
+        """Index (or re-index) text under key; re-indexed keys keep their position."""
+        low = self.fold((text or "").strip())
+        with self._lock:
+            ordinal = self._ordinals.get(key)
+            if ordinal is None:
+                ordinal = len(self._keys)
+                self._keys.append(key)
+                self._ordinals[key] = ordinal
+            else:
+                self._unpost(ordinal)
+            self._texts[ordinal] = low
+            for gram in ngrams(low, self.n):
+                self._postings.setdefault(gram, set()).add(ordinal)
+
+    def remove(self, key: str):
+        with self._lock:
+            ordinal = self._ordinals.pop(key, None)
+            if ordinal is not None:
+                self._unpost(ordinal)
+                del self._texts[ordinal]
+
+    def _unpost(self, ordinal: int):
+        for gram in ngrams(self._texts[ordinal], self.n):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(ordinal)
+                if not posting:
+                    del self._postings[gram]
+
+    def search(self, query: str) -> List[str]:
+        """Return keys whose folded text contains the folded query, in insertion order."""
+        qlow = self.fold(query)
+        with self._lock:
+            if len(qlow) < self.n:
+                candidates = self._texts.keys()
+            else:
+                postings = []
+                for gram in ngrams(qlow, self.n):
+                    posting = self._postings.get(gram)
+                    if not posting:
+                        return []
+                    postings.append(posting)
+                postings.sort(key=len)
+                candidates = set(postings[0])
+                for posting in postings[1:]:
+                    candidates &= posting
+                    if not candidates:
+                        return []
+            matches = [o for o in candidates if qlow in self._texts[o]]
+            matches.sort()
+            return [self._keys[o] for o in matches]
@@ -0,0 +1,82 @@
+"""Denormalized read model of /api/search results.
+
+For every question the store holds, SearchPayloads keeps the result object the
+API returns ({id, text, description, answers}) with answers already joined,
+together with its compact JSON encoding. A search response is then just the
+concatenation of the cached fragments of the matched questions.
+
+The read model is kept up to date from QuestionAnswerStore events: only the
+questions affected by a mutation are rebuilt. Events may arrive on another
+thread (the store watcher) while searches run: a question's payload and
+fragment are stored as one tuple, and a rebuild swaps the whole dict at once.
+"""
+
+import json
+from typing import Dict, Iterable, Optional, Tuple
+
+
+def _dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_array(fragments: Iterable[bytes]) -> bytes:
+    """Join pre-encoded JSON objects into a JSON array."""
+    return b"[" + b",".join(fragments) + b"]"
+
+
+class SearchPayloads:
+    def __init__(self, store):
+        self.store = store
+        # qid -> (result object, its JSON encoding)
+        self._entries: Dict[str, Tuple[dict, bytes]] = {}
+        self.rebuild()
+
+    def rebuild(self):
+        entries = {}
+        for qid, qobj in self.store.iter_questions():
+            payload = self._build(qid, qobj)
+            entries[qid] = (payload, _dumps(payload))
+        self._entries = entries
+
+    def _build(self, qid: str, qobj: dict) -> dict:
+        return {
+            "id": qid,
+            "text": (qobj.get("text") or "").strip(),
+            "description": qobj.get("description", ""),
+            "answers": self.store.get_answers_for_question(qid),
+        }
+
+    def rebuild_question(self, qid: str):
+        qobj = self.store.get_question(qid)
+        if qobj is None:
+            self._entries.pop(qid, None)
+            return
+        payload = self._build(qid, qobj)
+        self._entries[qid] = (payload, _dumps(payload))
+
+    def on_store_event(self, event: str, payload: dict):
+        if event == "reset":
+            self.rebuild()
+        elif event in ("add_question", "link", "remove_link"):
+            self.rebuild_question(payload["question_id"])
+        elif event == "add_answer":
+            for q in self.store.get_questions_for_answer(payload["answer_id"]):
+                self.rebuild_question(q["id"])
+
+    def __contains__(self, qid: str) -> bool:
+        return qid in self._entries
+
+    def get(self, qid: str) -> Optional[dict]:
+        entry = self._entries.get(qid)
+        return None if entry is None else entry[0]
+
+    def fragment(self, qid: str, similarity_score: Optional[float] = None) -> Optional[bytes]:
+        """Pre-encoded JSON object for qid, optionally with a similarity_score field;
+        None if the store has no question qid (yet, or any more)."""
+        entry = self._entries.get(qid)
+        if entry is None:
+            return None
+        frag = entry[1]
+        if similarity_score is None:
+            return frag
+        return frag[:-1] + b',"similarity_score":' + _dumps(round(similarity_score, 3)) + b"}"
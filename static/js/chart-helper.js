@@ -1,5 +1,14 @@
 // Centralized chart fetching + rendering helper
 // Expose as window.fetchAndRenderAnswerData(aid, cid, wrapper)
+
+// Decode the compact "f32" format of /api/answer-data: uint32 n, n float32 x, n float32 y (little-endian)
+function decodeChartF32(buffer) {
+  const n = new DataView(buffer).getUint32(0, true);
+  const x = new Float32Array(buffer.slice(4, 4 + 4 * n));
+  const y = new Float32Array(buffer.slice(4 + 4 * n, 4 + 8 * n));
+  return { x, y };
+}
+
 window.fetchAndRenderAnswerData = async function(aid, cid, wrapper, userOptions = {}) {
   // aid: answer id (string), cid: canvas id, wrapper: DOM element where canvas resides
   console.debug('fetchAndRenderAnswerData start', aid, cid);
@@ -12,7 +21,10 @@ window.fetchAndRenderAnswerData = async function(aid, cid, wrapper, userOptions
   try { wrapper.appendChild(startedEl); } catch(e){}
   try { document.getElementById('debug-log').textContent = `Chargement graphique id ${aid}...`; } catch(e){}
   try {
-    const resp = await fetch(`/api/answer-data/${aid}`);
+    // the server downsamples to about one point per device pixel of the chart width
+    const widthPx = Math.round((wrapper.clientWidth || 800) * (window.devicePixelRatio || 1));
+    const maxPoints = Math.max(3, Math.min(widthPx, 4000));
+    const resp = await fetch(`/api/answer-data/${aid}?max_points=${maxPoints}&format=f32`);
     if (!resp.ok) {
       const errEl = document.createElement('div');
       errEl.className = 'text-sm text-red-500';
@@ -21,7 +33,8 @@ window.fetchAndRenderAnswerData = async function(aid, cid, wrapper, userOptions
       wrapper.appendChild(errEl);
       return;
     }
-    const data = await resp.json();
+    const isBinary = (resp.headers.get('Content-Type') || '').includes('octet-stream');
+    const data = isBinary ? decodeChartF32(await resp.arrayBuffer()) : await resp.json();
     console.debug('Chart data for', aid, data);
     try { document.getElementById('debug-log').textContent = `Données reçues pour id ${aid}`; } catch(e){}
 
@@ -74,23 +87,26 @@ window.fetchAndRenderAnswerData = async function(aid, cid, wrapper, userOptions
       const chart = new Chart(ctx, {
         type: 'line',
         data: {
-          labels: (data.x || []).map(String),
           datasets: [{
             label: 'Valeurs',
-            data: data.y || [],
+            // {x, y} points on a linear x axis: downsampled points keep their real spacing
+            data: Array.from(data.x || [], (x, i) => ({ x, y: data.y[i] })),
             borderColor: '#6366f1',
             backgroundColor: gradient,
             tension: 0.35,
-            pointRadius: 4,
+            pointRadius: (data.x && data.x.length > 60) ? 0 : 4,
             pointBackgroundColor: '#6366f1'
           }]
         },
         options: {
           responsive: true,
+          parsing: false,
+          normalized: true,
           maintainAspectRatio: false,
           plugins: { legend: { display: false }, tooltip: { mode: 'index', intersect: false } },
           scales: {
             x: {
+              type: 'linear',
               ticks: { color: axisColor },
               grid: { color: 'transparent' },
               title: {
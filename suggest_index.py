@@ -0,0 +1,225 @@
+"""Prefix index behind /api/suggest (search-as-you-type).
+
+Phrases (question texts and descriptions, lines of data/keyphrase.txt) are
+folded like search queries (case, accents, whitespace: query_cache.normalize_query)
+and every word start of a folded phrase becomes a key of one sorted list, so the
+phrases completing a prefix are the contiguous run of keys found with bisect:
+
+    index = SuggestIndex(fold=normalize_query)
+    index.set_source(("question", "12"), ["Analyse fumée", "Détecter la fumée"], question_id="12")
+    index.suggest("fum")   # [{"text": "Analyse fumée", "question_id": "12"}, ...]
+
+Phrases are ranked by popularity: how many times the phrase itself was searched
+for (record()) plus the number of sources that contain it. Ties go to the
+shorter phrase. The top phrases of a prefix with a long run of keys are cached.
+Popularity only grows, so an added phrase or a new search can only move a
+phrase up, and the cached lists are updated in place. A prefix whose run loses
+a phrase drops its cached list.
+"""
+
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Keys are word starts of a phrase, cut to this many characters
+KEY_MAX_CHARS = 48
+# Word starts indexed per phrase
+MAX_WORDS = 12
+# Suggestions returned at most (the length of the cached lists)
+MAX_LIMIT = 20
+# Prefixes matching more keys than this get their top phrases cached
+SCAN_LIMIT = 64
+
+_WORD = re.compile(r"\w+")
+
+
+def _tails(folded: str) -> List[str]:
+    return [folded[m.start():m.start() + KEY_MAX_CHARS] for m in _WORD.finditer(folded)][:MAX_WORDS]
+
+
+class SuggestIndex:
+    def __init__(self, fold: Callable[[str], str] = str.lower):
+        self.fold = fold
+        self._lock = threading.RLock()
+        # phrase ordinal -> display text, folded text (None once removed), question id, popularity
+        self._texts: List[str] = []
+        self._folded: List[Optional[str]] = []
+        self._question_ids: List[Optional[str]] = []
+        self._popularity: List[int] = []
+        self._ordinals: Dict[str, int] = {}
+        # folded phrase -> times searched for; kept when the phrase goes (it may come back)
+        self._searches: Dict[str, int] = {}
+        # phrase ordinal -> sources containing it; source -> its phrase ordinals
+        self._sources_of: Dict[int, set] = {}
+        self._phrases_of: Dict[Hashable, List[int]] = {}
+        # sorted (key, phrase ordinal) pairs, as two parallel lists
+        self._keys: List[str] = []
+        self._key_phrases: List[int] = []
+        # prefix -> best phrase ordinals (at most MAX_LIMIT), for prefixes with long runs
+        self._top: Dict[str, List[int]] = {}
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    def _rank(self, ordinal: int) -> Tuple[int, int, str]:
+        folded = self._folded[ordinal]
+        return -self._popularity[ordinal], len(folded), folded
+
+    # --- building and updates ---
+
+    @classmethod
+    def build(cls, sources: Iterable[Tuple[Hashable, List[str], Optional[str]]],
+              fold: Callable[[str], str] = str.lower, searches: Optional[Dict[str, int]] = None) -> "SuggestIndex":
+        """Index (source, phrases, question_id) triples at once; searches: folded phrase -> search count."""
+        index = cls(fold)
+        index._searches = dict(searches or {})
+        pairs = []
+        for source, phrases, question_id in sources:
+            for ordinal in index._attach(source, phrases, question_id):
+                pairs.extend((key, ordinal) for key in _tails(index._folded[ordinal]))
+        pairs.sort()
+        index._keys = [key for key, _ordinal in pairs]
+        index._key_phrases = [ordinal for _key, ordinal in pairs]
+        return index
+
+    def _attach(self, source: Hashable, phrases: List[str], question_id: Optional[str]) -> List[int]:
+        """Register source's phrases; returns the ordinals of the phrases that are new to the index."""
+        new, attached = [], []
+        for text in phrases:
+            folded = self.fold(text or "")
+            if not folded:
+                continue
+            ordinal = self._ordinals.get(folded)
+            if ordinal is None:
+                ordinal = self._ordinals[folded] = len(self._texts)
+                self._texts.append(" ".join((text or "").split()))
+                self._folded.append(folded)
+                self._question_ids.append(question_id)
+                self._popularity.append(self._searches.get(folded, 0))
+                self._sources_of[ordinal] = set()
+                new.append(ordinal)
+            if source not in self._sources_of[ordinal]:
+                self._sources_of[ordinal].add(source)
+                self._popularity[ordinal] += 1
+                if self._question_ids[ordinal] is None:
+                    self._question_ids[ordinal] = question_id
+                attached.append(ordinal)
+        self._phrases_of.setdefault(source, []).extend(attached)
+        return new
+
+    def set_source(self, source: Hashable, phrases: List[str], question_id: Optional[str] = None):
+        """Make phrases the phrases of source (e.g. ("question", qid)), replacing its previous ones."""
+        with self._lock:
+            current = {self._folded[o] for o in self._phrases_of.get(source, ())}
+            if current and current == {f for f in map(self.fold, phrases) if f}:
+                # unchanged (e.g. an edit of another field): keep the phrases and their cached ranks
+                return
+            self._detach(source)
+            for ordinal in self._attach(source, phrases, question_id):
+                for key in _tails(self._folded[ordinal]):
+                    i = bisect_left(self._keys, key)
+                    self._keys.insert(i, key)
+                    self._key_phrases.insert(i, ordinal)
+            for ordinal in self._phrases_of.get(source, ()):
+                self._promote(ordinal)
+
+    def _detach(self, source: Hashable):
+        for ordinal in self._phrases_of.pop(source, ()):
+            sources = self._sources_of[ordinal]
+            sources.discard(source)
+            if sources:
+                self._popularity[ordinal] -= 1
+                # a lower rank: cached lists holding the phrase may be wrong now
+                self._drop_cached(ordinal)
+                continue
+            folded = self._folded[ordinal]
+            for key in _tails(folded):
+                i = bisect_left(self._keys, key)
+                while self._key_phrases[i] != ordinal:
+                    i += 1
+                del self._keys[i]
+                del self._key_phrases[i]
+            self._drop_cached(ordinal)
+            del self._ordinals[folded]
+            del self._sources_of[ordinal]
+            self._folded[ordinal] = None
+
+    def _cached_prefixes(self, ordinal: int) -> Iterable[str]:
+        seen = set()
+        for key in _tails(self._folded[ordinal]):
+            for n in range(1, len(key) + 1):
+                prefix = key[:n]
+                if prefix not in seen and prefix in self._top:
+                    seen.add(prefix)
+                    yield prefix
+
+    def _drop_cached(self, ordinal: int):
+        for prefix in list(self._cached_prefixes(ordinal)):
+            del self._top[prefix]
+
+    def _promote(self, ordinal: int):
+        """Move ordinal up (or into) the cached lists of its prefixes after its rank improved."""
+        rank = self._rank(ordinal)
+        for prefix in self._cached_prefixes(ordinal):
+            top = self._top[prefix]
+            if ordinal in top:
+                top.remove(ordinal)
+            elif len(top) >= MAX_LIMIT and rank >= self._rank(top[-1]):
+                continue
+            insort(top, ordinal, key=self._rank)
+            del top[MAX_LIMIT:]
+
+    def record(self, query: str) -> bool:
+        """Count a search for query (already folded); False if it is not a known phrase."""
+        ordinal = self._ordinals.get(query)
+        if ordinal is None:
+            return False
+        with self._lock:
+            if self._folded[ordinal] != query:
+                return False
+            self._searches[query] = self._searches.get(query, 0) + 1
+            self._popularity[ordinal] += 1
+            self._promote(ordinal)
+        return True
+
+    def searches(self) -> Dict[str, int]:
+        """Search counts by folded phrase (to carry popularity over to a rebuilt index)."""
+        with self._lock:
+            return dict(self._searches)
+
+    # --- queries ---
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Optional[str]]]:
+        """The limit most popular phrases with a word starting with prefix."""
+        folded = self.fold(prefix or "")
+        if not folded:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+        key = folded[:KEY_MAX_CHARS]
+        with self._lock:
+            top = self._top.get(key)
+            if top is None:
+                lo = bisect_left(self._keys, key)
+                hi = bisect_left(self._keys, key + "\U0010ffff", lo)
+                ordinals = set(self._key_phrases[lo:hi])
+                top = heapq.nsmallest(MAX_LIMIT, ordinals, key=self._rank)
+                if hi - lo > SCAN_LIMIT:
+                    self._top[key] = top
+            if len(folded) > KEY_MAX_CHARS:
+                top = [o for o in top if folded in self._folded[o]]
+            return [{"text": self._texts[o], "question_id": self._question_ids[o]} for o in top[:limit]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"phrases": len(self._ordinals), "keys": len(self._keys), "cached_prefixes": len(self._top)}
+
+
+def read_phrases(path: str) -> List[str]:
+    """Non-empty lines of a text file (one phrase per line); [] if it does not exist."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+    except OSError:
+        return []
@@ -0,0 +1,34 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qa_store import QuestionAnswerStore  # noqa: E402
+
+
+def test_batch_of_another_thread_is_not_joined(tmp_path):
+    path = str(tmp_path / "qa_store.json")
+    store = QuestionAnswerStore(path)
+    inside, added = threading.Event(), {}
+
+    def other_thread():
+        inside.wait()
+        added["qid"] = store.add_question("written by another thread")
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    try:
+        with store.batch():
+            store.add_question("rolled back")
+            inside.set()
+            # the other thread waits for this batch instead of joining it
+            thread.join(0.2)
+            assert thread.is_alive()
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    thread.join()
+
+    assert [q["text"] for _qid, q in store.iter_questions()] == ["written by another thread"]
+    assert QuestionAnswerStore(path).get_question(added["qid"]) is not None
@@ -0,0 +1,57 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from qa_store import QuestionAnswerStore  # noqa: E402
+from qa_wal import WriteAheadLog  # noqa: E402
+
+
+def test_torn_tail_is_cut_before_the_next_append(tmp_path):
+    path = str(tmp_path / "qa_store.json")
+    store = QuestionAnswerStore(path, wal=True)
+    first = store.add_question("before the crash")
+    # a crash in the middle of a write leaves a partial last line
+    with open(path + ".wal", "ab") as f:
+        f.write(b'[{"op":"add_question","question_id":"9","te')
+
+    store = QuestionAnswerStore(path, wal=True)
+    assert store.question_count() == 1
+    second = store.add_question("after the crash")
+    third = store.add_question("and another one")
+
+    reloaded = QuestionAnswerStore(path, wal=True)
+    assert [qid for qid, _q in reloaded.iter_questions()] == [first, second, third]
+    assert len(list(WriteAheadLog(path + ".wal").read())) == 3
+    # compaction folds every transaction logged after the crash
+    reloaded.compact_log()
+    assert QuestionAnswerStore(path).question_count() == 3
+
+
+def test_torn_tail_without_any_complete_line(tmp_path):
+    path = str(tmp_path / "qa_store.json")
+    with open(path + ".wal", "wb") as f:
+        f.write(b'[{"op":"add_qu')
+    store = QuestionAnswerStore(path, wal=True)
+    qid = store.add_question("first")
+    assert [q for q, _ in QuestionAnswerStore(path, wal=True).iter_questions()] == [qid]
+
+
+def test_compacting_a_store_without_log_creates_none(tmp_path):
+    path = str(tmp_path / "qa_store.json")
+    QuestionAnswerStore(path).add_question("snapshot only")
+    QuestionAnswerStore(path, wal=True).compact_log()
+    assert not os.path.exists(path + ".wal")
+
+
+def test_store_follows_a_log_created_later(tmp_path):
+    path = str(tmp_path / "qa_store.json")
+    snapshot_store = QuestionAnswerStore(path)
+    snapshot_store.add_question("in the snapshot")
+    logged = QuestionAnswerStore(path, wal=True).add_question("in the log")
+
+    assert snapshot_store.refresh()
+    assert snapshot_store.get_question(logged)["text"] == "in the log"
+    # its own writes now go to the log too
+    later = snapshot_store.add_question("after the switch")
+    assert [records[0]["question_id"] for records in WriteAheadLog(path + ".wal").read()] == [logged, later]
@@ -0,0 +1,242 @@
+"""Vector indexes for semantic search over the (normalized) question embeddings.
+
+All indexes answer search(query, k) -> (row indices, scores), best first, and
+updated(matrix, rows) -> a new index over a matrix whose rows are unchanged
+except the given ones (edited or appended), for live store changes:
+
+  - ExactIndex : brute-force dot product against every row (the exact reference)
+  - IVFIndex   : inverted-file index. Rows are clustered with k-means into n_lists
+                 lists; a query only scores the rows of its nprobe closest lists.
+                 Cost per query ~ n_lists + nprobe * N / n_lists dot products.
+  - Int8Index  : per-row scaled int8 codes (4x smaller than float32) scored with
+                 NumPy; the best candidates are optionally re-ranked with exact
+                 float scores so that score thresholds behave as with ExactIndex.
+                 Re-ranking keeps the float matrix referenced: the codes only save
+                 memory when it is the memory map (or when rerank is 0).
+                 Scoring is slower than the float32 BLAS product (no int8 GEMV).
+
+The matrix may be the read-only memory map shared by the gunicorn workers; the
+IVF index only keeps centroids and row-id lists on top of it.
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from embedding_index import score
+
+# Below this size the exact index is both faster and exact
+IVF_MIN_ROWS = 10000
+# Upper bound on the (rows x queries) score block computed at once by search_batch
+BATCH_SCORE_CELLS = 1 << 26
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self, matrix: np.ndarray):
+        self.matrix = matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = score(self.matrix, query)
+        idx = top_k(scores, k)
+        return idx, scores[idx]
+
+    def updated(self, matrix: np.ndarray, rows: np.ndarray) -> "ExactIndex":
+        return ExactIndex(matrix)
+
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """search() for a (B, dim) batch of queries, as matrix products over query chunks."""
+        results = []
+        chunk = max(1, BATCH_SCORE_CELLS // max(1, self.matrix.shape[0]))
+        for start in range(0, len(queries), chunk):
+            scores = score(self.matrix, queries[start:start + chunk])
+            for col in range(scores.shape[1]):
+                column = scores[:, col]
+                idx = top_k(column, k)
+                results.append((idx, column[idx]))
+        return results
+
+
+class IVFIndex:
+    kind = "ivf"
+
+    def __init__(self, matrix: np.ndarray, n_lists: Optional[int] = None, nprobe: int = 8,
+                 seed: int = 0, train_size: int = 50000):
+        from sklearn.cluster import MiniBatchKMeans
+
+        self.matrix = matrix
+        n = matrix.shape[0]
+        self.n_lists = n_lists or max(1, int(np.sqrt(n)))
+        self.nprobe = nprobe
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(n, train_size), replace=False))
+        kmeans = MiniBatchKMeans(n_clusters=self.n_lists, random_state=seed, n_init=1,
+                                 batch_size=4096).fit(np.asarray(matrix[sample], dtype=np.float32))
+        centroids = kmeans.cluster_centers_.astype(np.float32)
+        self.centroids = centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        # assign every row to its closest centroid (by cosine), block by block
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, 65536):
+            block = np.asarray(matrix[start:start + 65536], dtype=np.float32)
+            assign[start:start + block.shape[0]] = np.argmax(block @ self.centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        bounds = np.searchsorted(assign[order], np.arange(self.n_lists + 1))
+        self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.n_lists)]
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def updated(self, matrix: np.ndarray, rows: np.ndarray) -> "IVFIndex":
+        """Same centroids over matrix; only the given rows are (re)assigned to a list."""
+        rows = np.asarray(rows, dtype=np.int64)
+        index = object.__new__(IVFIndex)
+        index.matrix, index.n_lists, index.nprobe, index.centroids = matrix, self.n_lists, self.nprobe, self.centroids
+        moved = rows[rows < self.matrix.shape[0]]
+        lists = [lst[~np.isin(lst, moved)] for lst in self._lists] if moved.size else list(self._lists)
+        if rows.size:
+            assign = np.argmax(np.asarray(matrix[rows], dtype=np.float32) @ self.centroids.T, axis=1)
+            for list_id in np.unique(assign):
+                lists[list_id] = np.sort(np.concatenate([lists[list_id], rows[assign == list_id]]))
+        index._lists = lists
+        return index
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        probes = top_k(self.centroids @ query, nprobe or self.nprobe)
+        candidates = np.concatenate([self._lists[p] for p in probes])
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+        candidates.sort()  # sequential access into the (memory-mapped) matrix
+        scores = np.asarray(self.matrix[candidates], dtype=np.float32) @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search(q, k) for q in queries]
+
+
+def quantize_int8(matrix: np.ndarray, block_rows: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row symmetric int8 quantization: row ~= codes * scale."""
+    n, dim = matrix.shape
+    codes = np.empty((n, dim), dtype=np.int8)
+    scales = np.empty(n, dtype=np.float32)
+    for start in range(0, n, block_rows):
+        block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+        scale = np.abs(block).max(axis=1) / 127.0
+        scale[scale == 0] = 1.0
+        codes[start:start + block.shape[0]] = np.rint(block / scale[:, None]).astype(np.int8)
+        scales[start:start + block.shape[0]] = scale
+    return codes, scales
+
+
+class Int8Index:
+    kind = "int8"
+
+    def __init__(self, matrix: np.ndarray, rerank: int = 50, cache_path: Optional[str] = None,
+                 block_rows: int = 512):
+        """rerank: number of int8 candidates re-scored with the float matrix (0 = none,
+        and the float matrix is not kept).
+
+        cache_path: optional "<name>.int8.npy" file holding the codes, written once
+        and then memory-mapped (so workers share it like the float matrix). It is
+        only reused if it is newer than the memory-mapped float matrix.
+        """
+        # only re-ranking reads the float matrix; without it the codes are all that is kept
+        self.matrix = matrix if rerank else None
+        self.rerank = rerank
+        self.block_rows = block_rows
+        self.cache_path = cache_path
+        self.codes, scales = self._load_or_quantize(matrix, cache_path)
+        # score(row) = codes.q * scale / |codes * scale| = codes.q / |codes|
+        norms = np.empty(len(scales), dtype=np.float32)
+        for start in range(0, len(scales), block_rows):
+            block = np.asarray(self.codes[start:start + block_rows], dtype=np.float32)
+            norms[start:start + block.shape[0]] = np.linalg.norm(block, axis=1)
+        norms[norms == 0] = 1.0
+        self._inv_norms = 1.0 / norms
+
+    @staticmethod
+    def _load_or_quantize(matrix: np.ndarray, cache_path: Optional[str]):
+        source = getattr(matrix, "filename", None)
+        if cache_path:
+            scales_path = cache_path[:-len(".npy")] + "-scales.npy"
+            try:
+                fresh = source is not None and os.path.getmtime(cache_path) >= os.path.getmtime(source)
+                codes = np.load(cache_path, mmap_mode="r")
+                scales = np.load(scales_path)
+                if fresh and codes.shape == matrix.shape and scales.shape == (matrix.shape[0],):
+                    return codes, scales
+            except (OSError, ValueError):
+                pass
+        codes, scales = quantize_int8(matrix)
+        if cache_path:
+            try:
+                for path, arr in ((scales_path, scales), (cache_path, codes)):
+                    tmp = path + ".tmp%d" % os.getpid()
+                    with open(tmp, "wb") as f:
+                        np.save(f, arr)
+                    os.replace(tmp, path)
+                codes = np.load(cache_path, mmap_mode="r")
+            except OSError:
+                pass
+        return codes, scales
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    def updated(self, matrix: np.ndarray, rows: np.ndarray) -> "Int8Index":
+        # the codes cache is rewritten once (it is older than the new matrix), then shared again
+        return Int8Index(matrix, rerank=self.rerank, cache_path=self.cache_path, block_rows=self.block_rows)
+
+    def approximate_scores(self, query: np.ndarray) -> np.ndarray:
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        n = self.codes.shape[0]
+        out = np.empty(n, dtype=np.float32)
+        # small blocks upcast into a reused, cache-resident float32 buffer
+        buf = np.empty((min(self.block_rows, n), self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, n, self.block_rows):
+            block = self.codes[start:start + self.block_rows]
+            rows = block.shape[0]
+            np.copyto(buf[:rows], block, casting="unsafe")
+            np.dot(buf[:rows], query, out=out[start:start + rows])
+        out *= self._inv_norms
+        return out
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.approximate_scores(query)
+        if not self.rerank or self.matrix is None:
+            idx = top_k(scores, k)
+            return idx, scores[idx]
+        candidates = np.sort(top_k(scores, max(k, self.rerank)))
+        exact = np.asarray(self.matrix[candidates], dtype=np.float32) @ np.asarray(query, dtype=np.float32).reshape(-1)
+        best = top_k(exact, k)
+        return candidates[best], exact[best]
+
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search(q, k) for q in queries]
+
+
+def build_index(matrix: np.ndarray, kind: str = "exact", **kwargs):
+    """Build the vector index named kind ("exact", "ivf" or "int8") over matrix."""
+    if kind == "ivf" and matrix.shape[0] >= IVF_MIN_ROWS:
+        return IVFIndex(matrix, **kwargs)
+    if kind == "int8":
+        return Int8Index(matrix, **kwargs)
+    if kind not in ("exact", "ivf"):
+        raise ValueError(f"Unknown vector index: {kind}")
+    return ExactIndex(matrix)